@@ -20,9 +20,46 @@ INSTRUMENT_LIST_URL = (
     "https://images.dhan.co/api-data/api-scrip-master-detailed.csv"
 )
 
-# Delay between API calls (seconds) to respect rate limits.
+# Minimum delay between API calls (seconds) for endpoints that have no
+# entry in API_RATE_LIMITS (see DEFAULT_RATE_LIMIT).
 API_CALL_DELAY = 0.5
 
+# Per-endpoint rate limits as (requests per second, burst size).
+# Dhan publishes separate quotas for historical and rolling data; every
+# fetcher hitting the same endpoint shares one token bucket.
+API_RATE_LIMITS = {
+    "/charts/intraday": (5.0, 5),
+    "/charts/rollingoption": (5.0, 5),
+}
+
+# Fallback limit for endpoints not listed above.
+DEFAULT_RATE_LIMIT = (1.0 / API_CALL_DELAY, 1)
+
+# Limit across all Dhan API calls together, as (requests per second, burst
+# size). Every call takes a token from this bucket as well as from its
+# endpoint's, so fetchers running side by side (run_all.py) stay within
+# the account-wide quota too.
+API_GLOBAL_RATE_LIMIT = (5.0, 5)
+
+# Worker threads used to overlap API round-trips. The request rate is still
+# bounded by the rate limits above, so this only hides network latency.
+API_MAX_WORKERS = 16
+
+# Stocks fetched side by side. Their date windows all go through one pool
+# of API_MAX_WORKERS threads and share the same per-endpoint rate limit.
+STOCK_MAX_WORKERS = 8
+
+# Each stock run appends one part file; fold them back into a single
+# file once a stock has more parts than this.
+STOCK_COMPACT_PARTS = 30
+
+# Keep-alive connections kept open per host by the shared HTTP session.
+# Should be >= the requests that can be in flight at once, so no worker
+# waits for a free socket: run_all.py runs every fetcher together, with
+# API_MAX_WORKERS threads per options underlying (2), API_MAX_WORKERS for
+# all stocks and one thread per spot index (2).
+HTTP_POOL_SIZE = 3 * API_MAX_WORKERS + 2
+
 # ---------------------------------------------------------------------------
 # Output directory structure
 # ---------------------------------------------------------------------------
@@ -31,6 +68,12 @@ DATA_DIR = "data"
 SPOT_DIR = os.path.join(DATA_DIR, "spot")
 OPTIONS_DIR = os.path.join(DATA_DIR, "options")
 STOCKS_DIR = os.path.join(DATA_DIR, "stocks")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+# Local copy of the parsed instrument list, and how long (seconds) it is
+# reused before downloading a fresh one. Dhan updates it at most daily.
+INSTRUMENT_CACHE_PATH = os.path.join(CACHE_DIR, "instruments.parquet")
+INSTRUMENT_CACHE_TTL = 24 * 60 * 60
 
 # ---------------------------------------------------------------------------
 # Date ranges (inclusive start, exclusive end)
@@ -82,6 +125,21 @@ EXPIRY_FLAGS = ["WEEK", "MONTH"]
 # 1=near (current), 2=next, 3=far.
 EXPIRY_CODES = [1, 2, 3]
 
+# Longest window Dhan documents for one rolling-options request.
+ROLLING_MAX_WINDOW_DAYS = 30
+
+# Days per rolling-options request. A larger value can be tried: windows
+# longer than ROLLING_MAX_WINDOW_DAYS are split in half if Dhan rejects
+# them with HTTP 400, but every rejected request still costs a call
+# against the rate limit.
+OPTIONS_WINDOW_DAYS = ROLLING_MAX_WINDOW_DAYS
+
+# Fetch CE and PE for a strike with one rolling-options request instead of
+# two, by omitting drvOptionType (the response carries both "ce" and "pe").
+# Dhan documents drvOptionType as required, so this stays off until the
+# combined response has been verified against the live API.
+ROLLING_COMBINED_SIDES = False
+
 # ATM +/- 10 strike buckets for rolling options.
 STRIKE_BUCKETS = ["ATM"]
 for _i in range(1, 11):
@@ -89,6 +147,11 @@ for _i in range(1, 11):
 for _i in range(1, 11):
     STRIKE_BUCKETS.append(f"ATM-{_i}")
 
+# Numeric offset of each bucket: "ATM" -> 0, "ATM+3" -> 3, "ATM-7" -> -7.
+STRIKE_BUCKET_OFFSETS = {
+    b: 0 if b == "ATM" else int(b.replace("ATM", "")) for b in STRIKE_BUCKETS
+}
+
 # Strike step per index (distance between consecutive strikes).
 # NIFTY strikes: 14000, 14050, 14100 ... (step = 50)
 # SENSEX strikes: 48000, 48100, 48200 ... (step = 100)
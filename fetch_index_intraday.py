@@ -5,20 +5,21 @@ Fetch 1-minute intraday data for NIFTY 50 and S&P BSE SENSEX
 from Dhan's Historical Data APIs and store locally as Parquet.
 
 Date range: 2021-01-01 to today (IST).
-Output: data/spot/nifty/NIFTY_1m.parquet
-        data/spot/sensex/SENSEX_1m.parquet
+Output: data/spot/nifty/date=YYYY-MM-DD/part.parquet
+        data/spot/sensex/date=YYYY-MM-DD/part.parquet
+        (one partition per IST day; read the directory as one dataset)
 
 Columns (standard backtesting schema):
     ts        - epoch seconds (int64)
-    datetime  - ISO 8601 with IST offset (string)
+    datetime  - IST timestamp derived from ts (tz-aware, UTC+05:30)
     open      - open price (float64)
     high      - high price (float64)
     low       - low price (float64)
     close     - close price (float64)
     volume    - volume traded (int64)
 
-Supports incremental updates: if the Parquet file already exists,
-only fetches data after the last timestamp.
+Supports incremental updates: if partitions already exist, only fetches
+data after the last timestamp and rewrites only the days it touched.
 
 Usage:
     export DHAN_ACCESS_TOKEN='your-token'
@@ -27,8 +28,11 @@ Usage:
 
 import os
 import sys
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
 
 from config import (
@@ -41,21 +45,23 @@ from config import (
 )
 from utils import (
     IST,
+    add_datetime,
     build_auth_headers,
+    check_stop,
     ensure_dir,
-    epoch_to_ist_iso,
     extract_security_id,
     generate_date_windows,
     get_last_timestamp,
     load_instrument_list,
-    load_parquet,
-    merge_and_deduplicate,
+    log,
+    migrate_to_partitions,
+    pad_array,
     post_json,
     print_progress,
     resolve_index_instrument,
-    save_parquet,
-    throttle,
+    save_partitioned,
     today_ist,
+    worker_pool,
 )
 
 
@@ -66,27 +72,34 @@ INTRADAY_URL = DHAN_BASE_URL + "/charts/intraday"
 SPOT_DEDUP_COLS = ["ts"]
 
 
-def fetch_spot_for_index(
+def _fetch_spot_frames(
     name: str,
     security_id: str,
     headers: dict,
     start_date,
     end_date,
-) -> pd.DataFrame:
+    after_ts: Optional[int] = None,
+) -> List[pd.DataFrame]:
     """
-    Fetch all 1-minute candles for an index over a date range.
+    Fetch 1-minute candles for an index as a flat list of per-window frames.
 
-    Returns a DataFrame with standardized column names.
-    Fetches in <= 90-day windows as required by Dhan API.
+    Split sub-windows (after an HTTP 400) extend the same list, so the
+    caller concatenates everything exactly once.
     """
     windows = generate_date_windows(start_date, end_date, max_days=90)
-    all_rows = []
+    frames = []
 
     for w_idx, (d_from, d_to) in enumerate(windows, start=1):
+        check_stop()
+
         # Dhan intraday API expects datetime strings.
-        from_str = datetime(
+        from_dt = datetime(
             d_from.year, d_from.month, d_from.day, 0, 0, 0, tzinfo=IST
-        ).strftime("%Y-%m-%d %H:%M:%S")
+        )
+        if after_ts is not None:
+            # Resume from the minute after the last stored candle.
+            from_dt = max(from_dt, datetime.fromtimestamp(after_ts + 60, tz=IST))
+        from_str = from_dt.strftime("%Y-%m-%d %H:%M:%S")
         to_str = datetime(
             d_to.year, d_to.month, d_to.day, 23, 59, 59, tzinfo=IST
         ).strftime("%Y-%m-%d %H:%M:%S")
@@ -108,17 +121,15 @@ def fetch_spot_for_index(
         except RuntimeError as e:
             # If HTTP 400 for a large window, split into halves.
             if "HTTP 400" in str(e) and (d_to - d_from).days > 1:
-                print(f"  HTTP 400; splitting window for {name}...")
+                log(f"  HTTP 400; splitting window for {name}...")
                 mid = d_from + (d_to - d_from) // 2
                 # Recursively fetch each half.
-                df_left = fetch_spot_for_index(
-                    name, security_id, headers, d_from, mid
-                )
-                df_right = fetch_spot_for_index(
-                    name, security_id, headers, mid, d_to
-                )
-                all_rows.append(df_left)
-                all_rows.append(df_right)
+                frames.extend(_fetch_spot_frames(
+                    name, security_id, headers, d_from, mid, after_ts
+                ))
+                frames.extend(_fetch_spot_frames(
+                    name, security_id, headers, mid, d_to, after_ts
+                ))
                 continue
             raise
 
@@ -138,34 +149,106 @@ def fetch_spot_for_index(
                 f"{name}: Misaligned arrays for {d_from} -> {d_to}"
             )
 
-        # Pad volumes if shorter (some indices return empty volume).
-        if len(volumes) < n:
-            volumes = volumes + [0] * (n - len(volumes))
+        # Build one columnar frame per window from the API's arrays.
+        ts = np.asarray(timestamps, dtype=np.int64)
+        frame = pd.DataFrame({
+            "ts": ts,
+            "open": np.asarray(opens, dtype=np.float64),
+            "high": np.asarray(highs, dtype=np.float64),
+            "low": np.asarray(lows, dtype=np.float64),
+            "close": np.asarray(closes, dtype=np.float64),
+            # Some indices return an empty (or short) volume array.
+            "volume": pad_array(volumes, n, 0, dtype=np.int64),
+        })
+        if after_ts is not None:
+            frame = frame[frame["ts"] > after_ts]
+        if not frame.empty:
+            frames.append(frame)
+
+    return frames
 
-        # Build rows for this window.
-        for i in range(n):
-            ts = int(timestamps[i])
-            all_rows.append({
-                "ts": ts,
-                "datetime": epoch_to_ist_iso(ts),
-                "open": float(opens[i]),
-                "high": float(highs[i]),
-                "low": float(lows[i]),
-                "close": float(closes[i]),
-                "volume": int(volumes[i]),
-            })
 
-        throttle()
+def fetch_spot_for_index(
+    name: str,
+    security_id: str,
+    headers: dict,
+    start_date,
+    end_date,
+    after_ts: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Fetch all 1-minute candles for an index over a date range.
 
-    # Build DataFrame from collected rows (skip any sub-DataFrames from splits).
-    dicts = [r for r in all_rows if isinstance(r, dict)]
-    dfs = [r for r in all_rows if isinstance(r, pd.DataFrame)]
+    Returns a DataFrame with standardized column names.
+    Fetches in <= 90-day windows as required by Dhan API.
+
+    For incremental updates, pass after_ts (the last stored timestamp):
+    the first request starts at the following minute instead of midnight,
+    and any candle at or before after_ts is dropped.
+    """
+    frames = _fetch_spot_frames(
+        name, security_id, headers, start_date, end_date, after_ts
+    )
+    # Single concat of all window frames (including split sub-frames).
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
-    df = pd.DataFrame(dicts) if dicts else pd.DataFrame()
-    for sub_df in dfs:
-        df = pd.concat([df, sub_df], ignore_index=True)
 
-    return df
+def _fetch_one_index(
+    idx_info: dict,
+    instruments: pd.DataFrame,
+    headers: dict,
+    end: date,
+) -> None:
+    """
+    Fetch, merge and save spot data for one index (one worker's job).
+
+    Resolves the security ID, resumes from the last stored candle and
+    writes only the touched daily partitions.
+    """
+    name = idx_info["name"]
+    short = idx_info["short_name"]
+    out_dir = os.path.join(SPOT_DIR, short)
+    legacy_file = os.path.join(out_dir, f"{short.upper()}_1m.parquet")
+    migrate_to_partitions(legacy_file, out_dir, SPOT_DEDUP_COLS)
+
+    # Resolve the index instrument from Dhan's list.
+    best_row = resolve_index_instrument(instruments, name, INDEX_MATCH_RULES)
+    sec_id = extract_security_id(best_row)
+    log(f"  Resolved {name}: securityId={sec_id}")
+
+    # Determine start date (incremental update support).
+    start = SPOT_START_DATE
+    last_ts = get_last_timestamp(out_dir)
+    if last_ts is not None:
+        # Resume from the minute after the last timestamp.
+        resume_dt = datetime.fromtimestamp(last_ts, tz=IST) + timedelta(minutes=1)
+        start = resume_dt.date()
+        log(f"  Resuming {name} from {resume_dt:%Y-%m-%d %H:%M} (incremental update)")
+
+    if start >= end:
+        log(f"  {name} is already up to date.")
+        return
+
+    log(f"  Fetching {idx_info['display']} from {start} to {end}...")
+    new_df = fetch_spot_for_index(
+        name, sec_id, headers, start, end, after_ts=last_ts
+    )
+
+    if new_df.empty:
+        log(f"  No new data for {name}.")
+        return
+
+    # Enforce column types; datetime is derived from ts in one pass.
+    new_df["ts"] = new_df["ts"].astype("int64")
+    new_df = add_datetime(new_df)
+    new_df["open"] = new_df["open"].astype("float64")
+    new_df["high"] = new_df["high"].astype("float64")
+    new_df["low"] = new_df["low"].astype("float64")
+    new_df["close"] = new_df["close"].astype("float64")
+    new_df["volume"] = new_df["volume"].astype("int64")
+
+    # Merge into the touched daily partitions only.
+    save_partitioned(new_df, out_dir, SPOT_DEDUP_COLS)
 
 
 def run_spot_fetch() -> None:
@@ -177,9 +260,9 @@ def run_spot_fetch() -> None:
     ensure_dir(SPOT_DIR)
 
     # Load Dhan instrument list to find security IDs.
-    print("Downloading Dhan instrument list...")
-    rows = load_instrument_list()
-    print(f"  Loaded {len(rows)} instrument rows.")
+    log("Loading Dhan instrument list (cached for a day)...")
+    instruments = load_instrument_list()
+    log(f"  Loaded {len(instruments)} instrument rows.")
 
     headers = build_auth_headers()
 
@@ -197,53 +280,15 @@ def run_spot_fetch() -> None:
         },
     ]
 
-    for idx_info in indices:
-        name = idx_info["name"]
-        short = idx_info["short_name"]
-        out_dir = os.path.join(SPOT_DIR, short)
-        out_file = os.path.join(out_dir, f"{short.upper()}_1m.parquet")
-
-        # Resolve the index instrument from Dhan's list.
-        best_row = resolve_index_instrument(rows, name, INDEX_MATCH_RULES)
-        sec_id = extract_security_id(best_row)
-        print(f"  Resolved {name}: securityId={sec_id}")
-
-        # Determine start date (incremental update support).
-        start = SPOT_START_DATE
-        existing_df = load_parquet(out_file)
-        last_ts = get_last_timestamp(out_file)
-        if last_ts is not None:
-            # Resume from the day of the last timestamp.
-            last_dt = datetime.fromtimestamp(last_ts, tz=IST)
-            start = last_dt.date()
-            print(f"  Resuming {name} from {start} (incremental update)")
-
-        end = today_ist()
-        if start >= end:
-            print(f"  {name} is already up to date.")
-            continue
-
-        print(f"  Fetching {idx_info['display']} from {start} to {end}...")
-        new_df = fetch_spot_for_index(name, sec_id, headers, start, end)
-
-        if new_df.empty:
-            print(f"  No new data for {name}.")
-            continue
-
-        # Merge with existing data and deduplicate.
-        final_df = merge_and_deduplicate(existing_df, new_df, SPOT_DEDUP_COLS)
-
-        # Enforce column types.
-        final_df["ts"] = final_df["ts"].astype("int64")
-        final_df["open"] = final_df["open"].astype("float64")
-        final_df["high"] = final_df["high"].astype("float64")
-        final_df["low"] = final_df["low"].astype("float64")
-        final_df["close"] = final_df["close"].astype("float64")
-        final_df["volume"] = final_df["volume"].astype("int64")
-
-        save_parquet(final_df, out_file)
+    # Indices are independent, so fetch them side by side; the shared
+    # rate limiter in post_json keeps the combined call rate in check.
+    end = today_ist()
+    with worker_pool(len(indices)) as pool:
+        fetch_one = partial(_fetch_one_index, instruments=instruments, headers=headers, end=end)
+        # list() re-raises the first worker exception, if any.
+        list(pool.map(fetch_one, indices))
 
-    print("Spot data fetch complete.")
+    log("Spot data fetch complete.")
 
 
 if __name__ == "__main__":
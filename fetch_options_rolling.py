@@ -5,19 +5,21 @@ Fetch expired options data for NIFTY 50 and S&P BSE SENSEX
 from Dhan's Rolling Options API and store locally as Parquet.
 
 Date range: 2025-01-01 to today (IST).
-Output: data/options/nifty/NIFTY_OPTIONS_1m.parquet
-        data/options/sensex/SENSEX_OPTIONS_1m.parquet
+Output: data/options/nifty/expiry_type=*/expiry_code=*/date=YYYY-MM-DD/part.parquet
+        data/options/sensex/expiry_type=*/expiry_code=*/date=YYYY-MM-DD/part.parquet
+        (one shard per expiry series, one partition per IST day; read the
+        directory as one dataset, e.g. with load_options)
 
 Columns (standard backtesting schema):
     ts             - epoch seconds (int64)
-    datetime       - ISO 8601 with IST offset (string)
-    underlying     - "NIFTY" or "SENSEX" (string)
-    option_type    - "CE" or "PE" (string)
-    expiry_type    - "WEEK" or "MONTH" (string)
+    datetime       - IST timestamp derived from ts (tz-aware, UTC+05:30)
+    underlying     - "NIFTY" or "SENSEX" (category)
+    option_type    - "CE" or "PE" (category)
+    expiry_type    - "WEEK" or "MONTH" (category)
     expiry_code    - 1=near, 2=next, 3=far (int8)
     atm_strike     - ATM strike = spot rounded to nearest step (float64)
     strike_offset  - numeric offset from ATM: 0, +1, -1, ... (int8)
-    moneyness      - "ITM", "ATM", or "OTM" (string)
+    moneyness      - "ITM", "ATM", or "OTM" (category)
     strike         - actual strike price (float64)
     spot           - underlying spot price (float64)
     open           - option open price (float64)
@@ -37,11 +39,16 @@ Usage:
 
 import os
 import sys
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Iterator, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 from config import (
+    API_MAX_WORKERS,
     BSE_FNO,
     DHAN_BASE_URL,
     EXPIRY_CODES,
@@ -51,28 +58,35 @@ from config import (
     OPTIDX,
     OPTIONS_DIR,
     OPTIONS_START_DATE,
+    OPTIONS_WINDOW_DAYS,
+    ROLLING_COMBINED_SIDES,
+    ROLLING_MAX_WINDOW_DAYS,
+    STRIKE_BUCKET_OFFSETS,
     STRIKE_BUCKETS,
     STRIKE_STEPS,
 )
 from utils import (
     IST,
+    STOP_EVENT,
+    add_datetime,
     build_auth_headers,
+    check_stop,
     compute_atm_strike,
     compute_moneyness,
     ensure_dir,
-    epoch_to_ist_iso,
     extract_security_id,
     generate_date_windows,
     get_last_timestamp,
     load_instrument_list,
-    load_parquet,
-    merge_and_deduplicate,
+    log,
+    migrate_to_partitions,
+    pad_array,
     post_json,
     print_progress,
     resolve_index_instrument,
-    save_parquet,
-    throttle,
+    save_partitioned,
     today_ist,
+    worker_pool,
 )
 
 
@@ -85,31 +99,205 @@ OPTIONS_DEDUP_COLS = [
     "ts", "underlying", "option_type", "expiry_type", "expiry_code", "strike",
 ]
 
+# Options are sharded by expiry series: <dir>/expiry_type=WEEK/expiry_code=1/
+# date=.../part.parquet. Each (expiry_type, expiry_code) pair gets its own
+# directory tree, so readers can skip the series they do not need.
+OPTIONS_SHARD_COLS = ("expiry_type", "expiry_code")
+
+# Explicit schema (shard columns are dropped from it when writing files).
+# The string columns hold 2-3 distinct values across millions of rows, so
+# they are stored dictionary-encoded.
+_CATEGORY = pa.dictionary(pa.int8(), pa.string())
+OPTIONS_SCHEMA = pa.schema([
+    ("ts", pa.int64()),
+    ("datetime", pa.timestamp("ms", tz="+05:30")),
+    ("underlying", _CATEGORY),
+    ("option_type", _CATEGORY),
+    ("expiry_type", _CATEGORY),
+    ("expiry_code", pa.int8()),
+    ("atm_strike", pa.float64()),
+    ("strike_offset", pa.int8()),
+    ("moneyness", _CATEGORY),
+    ("strike", pa.float64()),
+    ("spot", pa.float64()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+    ("oi", pa.int64()),
+    ("iv", pa.float64()),
+])
+
+
+# Fields requested from the rolling API (shared by every request).
+_REQUIRED_DATA = (
+    "open", "high", "low", "close",
+    "volume", "oi", "iv",
+    "strike", "spot",
+)
 
-def _parse_strike_offset(bucket: str) -> int:
-    """
-    Parse numeric strike offset from bucket string.
+# Response keys and labels to read for each requested drvOptionType.
+# None means drvOptionType is omitted and both sides come back at once.
+_SIDE_KEYS = {
+    "CALL": (("ce", "CE"),),
+    "PUT": (("pe", "PE"),),
+    None: (("ce", "CE"), ("pe", "PE")),
+}
 
-    "ATM" -> 0, "ATM+3" -> 3, "ATM-7" -> -7
-    """
-    if bucket == "ATM":
-        return 0
-    return int(bucket.replace("ATM", ""))
+# drvOptionType values to request per strike.
+OPTION_SIDES = [None] if ROLLING_COMBINED_SIDES else ["CALL", "PUT"]
 
 
 def _count_total_api_calls(n_windows: int) -> int:
     """
     Calculate total API calls for progress reporting.
 
-    Per window: expiry_flags * expiry_codes * strike_buckets * option_types
-    = 2 * 3 * 21 * 2 = 252 calls per window.
+    Per window: expiry_flags * expiry_codes * strike_buckets * requests per strike
+    = 2 * 3 * 21 * 2 = 252 calls per window (126 with ROLLING_COMBINED_SIDES).
     """
     calls_per_window = (
-        len(EXPIRY_FLAGS) * len(EXPIRY_CODES) * len(STRIKE_BUCKETS) * 2
+        len(EXPIRY_FLAGS) * len(EXPIRY_CODES) * len(STRIKE_BUCKETS)
+        * len(OPTION_SIDES)
     )
     return n_windows * calls_per_window
 
 
+def _side_frame(
+    side: dict,
+    name: str,
+    opt_label: str,
+    expiry_flag: str,
+    expiry_code: int,
+    bucket: str,
+    strike_step: int,
+) -> Optional[pd.DataFrame]:
+    """
+    Build one columnar frame from the CE or PE part of a rolling response.
+
+    Returns None if the side has no candles.
+    """
+    timestamps = side.get("timestamp") or []
+    if not timestamps:
+        return None
+
+    n = len(timestamps)
+    ts = np.asarray(timestamps, dtype=np.int64)
+
+    # Spot / strike may contain blanks; coerce those to NaN.
+    spot = pad_array(side.get("spot"), n, np.nan, numeric=True)
+    strike = pad_array(side.get("strike"), n, np.nan, numeric=True)
+
+    # Compute ATM strike from spot, then moneyness (ITM / ATM / OTM).
+    atm = compute_atm_strike(spot, strike_step)
+    moneyness = compute_moneyness(opt_label, strike, spot, atm)
+
+    # Build one columnar frame straight from the API's parallel arrays.
+    return pd.DataFrame({
+        "ts": ts,
+        "underlying": name,
+        "option_type": opt_label,
+        "expiry_type": expiry_flag,
+        "expiry_code": np.int8(expiry_code),
+        "atm_strike": atm,
+        "strike_offset": np.int8(STRIKE_BUCKET_OFFSETS[bucket]),
+        "moneyness": moneyness,
+        "strike": strike,
+        "spot": spot,
+        "open": pad_array(side.get("open"), n, np.nan),
+        "high": pad_array(side.get("high"), n, np.nan),
+        "low": pad_array(side.get("low"), n, np.nan),
+        "close": pad_array(side.get("close"), n, np.nan),
+        "volume": pad_array(side.get("volume"), n, 0, dtype=np.int64),
+        "oi": pad_array(side.get("oi"), n, 0, dtype=np.int64),
+        "iv": pad_array(side.get("iv"), n, np.nan),
+    })
+
+
+def _with_dates(payload: dict, d_from: date, d_to: date) -> dict:
+    """Copy of payload with fromDate / toDate set to the given window."""
+    return {
+        **payload,
+        "fromDate": d_from.strftime("%Y-%m-%d"),
+        "toDate": d_to.strftime("%Y-%m-%d"),
+    }
+
+
+def _fetch_option_combo(
+    name: str,
+    strike_step: int,
+    headers: dict,
+    window_payload: dict,
+    d_from: date,
+    d_to: date,
+    combo: Tuple[str, int, str, Optional[str]],
+) -> Optional[pd.DataFrame]:
+    """
+    Fetch one (expiry_flag, expiry_code, bucket, side) combo for one window.
+
+    window_payload holds the request fields shared by every combo of the
+    window (see _with_dates); only the combo's own keys are added here.
+    A side of None asks for CE and PE in a single request.
+    If Dhan rejects a window longer than ROLLING_MAX_WINDOW_DAYS with
+    HTTP 400, it is split in half and each half is fetched recursively;
+    within the documented maximum a 400 is a rejected combo and skipped.
+    Returns the candles for this combo as a DataFrame (None on errors / no data,
+    or once the run is interrupted).
+    Runs inside a worker thread, so it must not touch shared state.
+    """
+    if STOP_EVENT.is_set():
+        return None
+    expiry_flag, expiry_code, bucket, opt_side = combo
+
+    payload = {
+        **window_payload,
+        "expiryFlag": expiry_flag,
+        "expiryCode": expiry_code,
+        "strike": bucket,
+    }
+    if opt_side is not None:
+        payload["drvOptionType"] = opt_side
+
+    try:
+        data = post_json(ROLLING_URL, payload, headers)
+    except RuntimeError as e:
+        # If HTTP 400 for a window over the documented maximum, split it
+        # into halves that do not share a day.
+        if "HTTP 400" in str(e) and (d_to - d_from).days > ROLLING_MAX_WINDOW_DAYS:
+            mid = d_from + (d_to - d_from) // 2
+            halves = [
+                _fetch_option_combo(
+                    name, strike_step, headers,
+                    _with_dates(window_payload, lo, hi), lo, hi, combo,
+                )
+                for lo, hi in ((d_from, mid), (mid + timedelta(days=1), d_to))
+            ]
+            halves = [h for h in halves if h is not None]
+            return pd.concat(halves, ignore_index=True) if halves else None
+        # Skip other errors for individual combos (log and continue).
+        return None
+
+    if not data:
+        return None
+
+    # Extract the CE and/or PE side from the response.
+    sides = data.get("data") or {}
+    frames = []
+    for side_key, opt_label in _SIDE_KEYS[opt_side]:
+        side = sides.get(side_key)
+        if not side:
+            continue
+        frame = _side_frame(
+            side, name, opt_label, expiry_flag, expiry_code, bucket, strike_step
+        )
+        if frame is not None:
+            frames.append(frame)
+
+    if not frames:
+        return None
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
 def fetch_options_for_underlying(
     name: str,
     security_id: str,
@@ -118,142 +306,176 @@ def fetch_options_for_underlying(
     headers: dict,
     start_date,
     end_date,
-) -> pd.DataFrame:
+) -> Iterator[pd.DataFrame]:
     """
-    Fetch rolling options data for one underlying.
+    Fetch rolling options data for one underlying, one window at a time.
 
     Iterates over: date windows x expiry types x expiry codes x strikes x CE/PE.
-    Returns a DataFrame with standardized columns.
+    The 252 combos of each window are fetched concurrently by a pool of
+    API_MAX_WORKERS threads; post_json's rate limiter keeps the call rate
+    within Dhan's quota.
+    Yields one DataFrame with standardized columns per non-empty window,
+    so callers can save each window before the next is fetched.
     """
-    # Rolling options API uses 30-day windows.
-    windows = generate_date_windows(start_date, end_date, max_days=30)
+    # Rolling options API takes up to OPTIONS_WINDOW_DAYS per call.
+    windows = generate_date_windows(
+        start_date, end_date, max_days=OPTIONS_WINDOW_DAYS
+    )
     total_calls = _count_total_api_calls(len(windows))
     call_count = 0
-    all_rows = []
-
-    for w_idx, (d_from, d_to) in enumerate(windows, start=1):
-        from_str = d_from.strftime("%Y-%m-%d")
-        to_str = d_to.strftime("%Y-%m-%d")
-
-        print(f"\n  [{name}] Window {w_idx}/{len(windows)}: {from_str} -> {to_str}")
-
-        for expiry_flag in EXPIRY_FLAGS:
-            for expiry_code in EXPIRY_CODES:
-                for bucket in STRIKE_BUCKETS:
-                    for opt_side, opt_label in (("CALL", "CE"), ("PUT", "PE")):
-                        call_count += 1
-
-                        # Show progress every 50 calls.
-                        if call_count % 50 == 0:
-                            print_progress(
-                                call_count, total_calls,
-                                f"{name} {expiry_flag} code={expiry_code} "
-                                f"{bucket} {opt_label}"
-                            )
-
-                        payload = {
-                            "exchangeSegment": exch_segment,
-                            "interval": "1",
-                            "securityId": security_id,
-                            "instrument": OPTIDX,
-                            "expiryFlag": expiry_flag,
-                            "expiryCode": expiry_code,
-                            "strike": bucket,
-                            "drvOptionType": opt_side,
-                            "requiredData": [
-                                "open", "high", "low", "close",
-                                "volume", "oi", "iv",
-                                "strike", "spot",
-                            ],
-                            "fromDate": from_str,
-                            "toDate": to_str,
-                        }
-
-                        try:
-                            data = post_json(ROLLING_URL, payload, headers)
-                        except RuntimeError:
-                            # Skip errors for individual combos (log and continue).
-                            continue
-
-                        if not data:
-                            continue
-
-                        # Extract the CE or PE side from the response.
-                        side_key = "ce" if opt_side == "CALL" else "pe"
-                        side = (data.get("data") or {}).get(side_key)
-                        if not side:
-                            continue
-
-                        timestamps = side.get("timestamp") or []
-                        if not timestamps:
-                            continue
-
-                        opens = side.get("open") or []
-                        highs = side.get("high") or []
-                        lows = side.get("low") or []
-                        closes = side.get("close") or []
-                        vols = side.get("volume") or []
-                        ois = side.get("oi") or []
-                        ivs = side.get("iv") or []
-                        strikes = side.get("strike") or []
-                        spots = side.get("spot") or []
-
-                        n = len(timestamps)
-                        offset = _parse_strike_offset(bucket)
-
-                        # Build rows from this API response.
-                        for i in range(n):
-                            ts = int(timestamps[i])
-
-                            # Safe access for arrays that might be shorter.
-                            spot_val = spots[i] if i < len(spots) else None
-                            strike_val = strikes[i] if i < len(strikes) else None
-
-                            # Compute ATM strike from spot.
-                            atm = None
-                            if spot_val is not None and spot_val != "":
-                                spot_f = float(spot_val)
-                                atm = compute_atm_strike(spot_f, strike_step)
-                            else:
-                                spot_f = None
-
-                            # Compute moneyness (ITM / ATM / OTM).
-                            moneyness = ""
-                            if (
-                                strike_val is not None
-                                and strike_val != ""
-                                and spot_f is not None
-                                and atm is not None
-                            ):
-                                moneyness = compute_moneyness(
-                                    opt_label, float(strike_val), spot_f, atm
-                                )
-
-                            all_rows.append({
-                                "ts": ts,
-                                "datetime": epoch_to_ist_iso(ts),
-                                "underlying": name,
-                                "option_type": opt_label,
-                                "expiry_type": expiry_flag,
-                                "expiry_code": expiry_code,
-                                "atm_strike": float(atm) if atm else None,
-                                "strike_offset": offset,
-                                "moneyness": moneyness,
-                                "strike": float(strike_val) if strike_val not in (None, "") else None,
-                                "spot": spot_f,
-                                "open": float(opens[i]) if i < len(opens) else None,
-                                "high": float(highs[i]) if i < len(highs) else None,
-                                "low": float(lows[i]) if i < len(lows) else None,
-                                "close": float(closes[i]) if i < len(closes) else None,
-                                "volume": int(vols[i]) if i < len(vols) else 0,
-                                "oi": int(ois[i]) if i < len(ois) else 0,
-                                "iv": float(ivs[i]) if i < len(ivs) else None,
-                            })
-
-                        throttle()
-
-    print(f"\n  [{name}] Completed {call_count} API calls, collected {len(all_rows)} rows.")
-    return pd.DataFrame(all_rows) if all_rows else pd.DataFrame()
+    n_rows = 0
+
+    # Request fields that never change for this underlying.
+    base_payload = {
+        "exchangeSegment": exch_segment,
+        "interval": "1",
+        "securityId": security_id,
+        "instrument": OPTIDX,
+        "requiredData": _REQUIRED_DATA,
+    }
+
+    # Every (expiry_flag, expiry_code, bucket, side) combo, same for all windows.
+    combos = [
+        (expiry_flag, expiry_code, bucket, opt_side)
+        for expiry_flag in EXPIRY_FLAGS
+        for expiry_code in EXPIRY_CODES
+        for bucket in STRIKE_BUCKETS
+        for opt_side in OPTION_SIDES
+    ]
+
+    with worker_pool(API_MAX_WORKERS) as pool:
+        for w_idx, (d_from, d_to) in enumerate(windows, start=1):
+            check_stop()
+            log(f"\n  [{name}] Window {w_idx}/{len(windows)}: {d_from} -> {d_to}")
+            frames = []
+
+            fetch_combo = partial(
+                _fetch_option_combo,
+                name, strike_step, headers,
+                _with_dates(base_payload, d_from, d_to), d_from, d_to,
+            )
+
+            # pool.map yields results in combo order as they complete.
+            for combo, chunk in zip(combos, pool.map(fetch_combo, combos)):
+                call_count += 1
+
+                # Show progress every 50 calls.
+                if call_count % 50 == 0:
+                    expiry_flag, expiry_code, bucket, opt_side = combo
+                    labels = "+".join(label for _, label in _SIDE_KEYS[opt_side])
+                    print_progress(
+                        call_count, total_calls,
+                        f"{name} {expiry_flag} code={expiry_code} "
+                        f"{bucket} {labels}"
+                    )
+
+                if chunk is not None and not chunk.empty:
+                    frames.append(chunk)
+
+            # Combos skipped after an interrupt would leave holes; keep the
+            # window out of the saved data so the next run fetches it again.
+            check_stop()
+            if frames:
+                window_df = pd.concat(frames, ignore_index=True)
+                n_rows += len(window_df)
+                yield window_df
+
+    log(f"\n  [{name}] Completed {call_count} API calls, collected {n_rows} rows.")
+
+
+def load_options(path: str, **kwargs) -> Optional[pd.DataFrame]:
+    """
+    Load a sharded options dataset (or None if path does not exist).
+
+    Extra keyword arguments go to pandas.read_parquet, e.g.
+    filters=[("expiry_type", "=", "WEEK"), ("expiry_code", "=", 1)] reads
+    only that series' shard. Shard keys are rebuilt from the directory
+    names; expiry_code is restored to int8 and columns to schema order.
+    """
+    if not os.path.exists(path):
+        return None
+    df = pd.read_parquet(path, engine="pyarrow", **kwargs)
+    if "expiry_code" in df.columns:
+        df["expiry_code"] = df["expiry_code"].astype("int8")
+    order = [c for c in OPTIONS_SCHEMA.names if c in df.columns]
+    return df[order + [c for c in df.columns if c not in order]]
+
+
+def _fetch_one_underlying(
+    ul: dict,
+    instruments: pd.DataFrame,
+    headers: dict,
+    end: date,
+) -> None:
+    """
+    Fetch, merge and save options data for one underlying (one worker's job).
+
+    Resolves the underlying's security ID, resumes from the last stored
+    day and writes only the touched daily partitions.
+    """
+    name = ul["name"]
+    short = ul["short_name"]
+    out_dir = os.path.join(OPTIONS_DIR, short)
+    legacy_file = os.path.join(out_dir, f"{name}_OPTIONS_1m.parquet")
+    migrate_to_partitions(
+        legacy_file, out_dir, OPTIONS_DEDUP_COLS, OPTIONS_SCHEMA,
+        OPTIONS_SHARD_COLS,
+    )
+    strike_step = STRIKE_STEPS[name]
+
+    # Resolve the underlying's security ID.
+    best_row = resolve_index_instrument(
+        instruments, ul["match_name"], INDEX_MATCH_RULES
+    )
+    sec_id = extract_security_id(best_row)
+    log(f"  Resolved {name}: securityId={sec_id}")
+
+    # Determine start date (incremental update).
+    start = OPTIONS_START_DATE
+    last_ts = get_last_timestamp(out_dir)
+    if last_ts is not None:
+        # The rolling API only takes whole dates, so re-fetch the whole last
+        # stored day: combos that failed on it get another chance, and
+        # save_partitioned drops the candles already stored.
+        start = datetime.fromtimestamp(last_ts, tz=IST).date()
+        log(f"  Resuming {name} options from {start} (incremental)")
+
+    if start >= end:
+        log(f"  {name} options are already up to date.")
+        return
+
+    log(f"  Fetching {name} options from {start} to {end}...")
+    windows = fetch_options_for_underlying(
+        name=name,
+        security_id=sec_id,
+        exch_segment=ul["exch_segment"],
+        strike_step=strike_step,
+        headers=headers,
+        start_date=start,
+        end_date=end,
+    )
+
+    # Save each window as soon as it arrives, so memory stays bounded to
+    # one window and an interrupted run resumes after the last saved one.
+    saved_any = False
+    for new_df in windows:
+        # Enforce column types; datetime is derived from ts in one pass.
+        new_df["ts"] = new_df["ts"].astype("int64")
+        new_df = add_datetime(new_df)
+        new_df["expiry_code"] = new_df["expiry_code"].astype("int8")
+        new_df["strike_offset"] = new_df["strike_offset"].astype("int8")
+        new_df["volume"] = new_df["volume"].fillna(0).astype("int64")
+        new_df["oi"] = new_df["oi"].fillna(0).astype("int64")
+
+        # Merge into the touched shards and daily partitions only.
+        save_partitioned(
+            new_df, out_dir, OPTIONS_DEDUP_COLS, OPTIONS_SCHEMA,
+            OPTIONS_SHARD_COLS,
+        )
+        saved_any = True
+
+    if not saved_any:
+        log(f"  No new data for {name} options.")
 
 
 def run_options_fetch() -> None:
@@ -264,9 +486,9 @@ def run_options_fetch() -> None:
     """
     ensure_dir(OPTIONS_DIR)
 
-    print("Downloading Dhan instrument list...")
-    rows = load_instrument_list()
-    print(f"  Loaded {len(rows)} instrument rows.")
+    log("Loading Dhan instrument list (cached for a day)...")
+    instruments = load_instrument_list()
+    log(f"  Loaded {len(instruments)} instrument rows.")
 
     headers = build_auth_headers()
 
@@ -286,64 +508,17 @@ def run_options_fetch() -> None:
         },
     ]
 
-    for ul in underlyings:
-        name = ul["name"]
-        short = ul["short_name"]
-        out_dir = os.path.join(OPTIONS_DIR, short)
-        out_file = os.path.join(out_dir, f"{name}_OPTIONS_1m.parquet")
-        strike_step = STRIKE_STEPS[name]
-
-        # Resolve the underlying's security ID.
-        best_row = resolve_index_instrument(
-            rows, ul["match_name"], INDEX_MATCH_RULES
-        )
-        sec_id = extract_security_id(best_row)
-        print(f"  Resolved {name}: securityId={sec_id}")
-
-        # Determine start date (incremental update).
-        start = OPTIONS_START_DATE
-        existing_df = load_parquet(out_file)
-        last_ts = get_last_timestamp(out_file)
-        if last_ts is not None:
-            last_dt = datetime.fromtimestamp(last_ts, tz=IST)
-            start = last_dt.date()
-            print(f"  Resuming {name} options from {start} (incremental)")
-
-        end = today_ist()
-        if start >= end:
-            print(f"  {name} options are already up to date.")
-            continue
-
-        print(f"  Fetching {name} options from {start} to {end}...")
-        new_df = fetch_options_for_underlying(
-            name=name,
-            security_id=sec_id,
-            exch_segment=ul["exch_segment"],
-            strike_step=strike_step,
-            headers=headers,
-            start_date=start,
-            end_date=end,
+    # NIFTY (NSE_FNO) and SENSEX (BSE_FNO) are independent, so fetch them
+    # side by side; the shared rate limiter keeps the combined call rate
+    # within Dhan's quota.
+    end = today_ist()
+    with worker_pool(len(underlyings)) as pool:
+        fetch_one = partial(
+            _fetch_one_underlying, instruments=instruments, headers=headers, end=end
         )
+        list(pool.map(fetch_one, underlyings))
 
-        if new_df.empty:
-            print(f"  No new data for {name} options.")
-            continue
-
-        # Merge with existing and deduplicate.
-        final_df = merge_and_deduplicate(
-            existing_df, new_df, OPTIONS_DEDUP_COLS
-        )
-
-        # Enforce column types.
-        final_df["ts"] = final_df["ts"].astype("int64")
-        final_df["expiry_code"] = final_df["expiry_code"].astype("int8")
-        final_df["strike_offset"] = final_df["strike_offset"].astype("int8")
-        final_df["volume"] = final_df["volume"].fillna(0).astype("int64")
-        final_df["oi"] = final_df["oi"].fillna(0).astype("int64")
-
-        save_parquet(final_df, out_file)
-
-    print("Options data fetch complete.")
+    log("Options data fetch complete.")
 
 
 if __name__ == "__main__":
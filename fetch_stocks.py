@@ -5,19 +5,22 @@ Fetch 1-minute intraday data for all Nifty 100 stocks
 from Dhan's Historical Data APIs and store locally as Parquet.
 
 Date range: 2023-01-01 to today (IST), i.e. 3 years.
-Output: data/stocks/{SYMBOL}/{SYMBOL}_1m.parquet (one file per stock)
+Output: data/stocks/{SYMBOL}/part-<first ts>-<last ts>.parquet
+        (one directory per stock; each run appends one part with the new
+        candles, and parts are compacted once there are more than
+        STOCK_COMPACT_PARTS; read the directory as one dataset)
 
 Columns (standard backtesting schema, same as spot index data):
     ts        - epoch seconds (int64)
-    datetime  - ISO 8601 with IST offset (string)
+    datetime  - IST timestamp derived from ts (tz-aware, UTC+05:30)
     open      - open price (float64)
     high      - high price (float64)
     low       - low price (float64)
     close     - close price (float64)
     volume    - volume traded (int64)
 
-Stock symbol is stored as Parquet file metadata (not a repeated column),
-since each file contains data for only one stock.
+The stock symbol is not a repeated column: each directory contains data
+for only one stock.
 
 Supports incremental updates: skips already-fetched date ranges.
 
@@ -28,32 +31,51 @@ Usage:
 
 import os
 import sys
-from datetime import datetime
-from typing import Dict, List, Optional
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from datetime import date, datetime
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 from config import (
+    API_MAX_WORKERS,
     DHAN_BASE_URL,
     NIFTY_100_SYMBOLS,
     STOCKS_DIR,
     STOCKS_START_DATE,
+    STOCK_COMPACT_PARTS,
+    STOCK_MAX_WORKERS,
 )
 from utils import (
     IST,
+    STOP_EVENT,
+    add_datetime,
+    append_part,
     build_auth_headers,
+    check_stop,
+    coalesce_columns,
+    compact_parts,
     ensure_dir,
-    epoch_to_ist_iso,
     generate_date_windows,
     get_last_timestamp,
+    list_parts,
     load_instrument_list,
     load_parquet,
+    log,
     merge_and_deduplicate,
+    pad_array,
     post_json,
     print_progress,
-    save_parquet,
-    throttle,
     today_ist,
+    worker_pool,
 )
 
 
@@ -67,9 +89,38 @@ EQUITY = "EQUITY"
 # Dedup columns for stock data.
 STOCK_DEDUP_COLS = ["ts"]
 
+# Explicit on-disk schema, so parts written by different runs always
+# share the same column types.
+STOCK_SCHEMA = pa.schema([
+    ("ts", pa.int64()),
+    ("datetime", pa.timestamp("ms", tz="+05:30")),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+])
+
+
+def _enforce_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast stock columns to their stored types.
+
+    datetime is derived from ts in one pass, which also replaces the ISO
+    strings stored by older versions.
+    """
+    df["ts"] = df["ts"].astype("int64")
+    df = add_datetime(df)
+    df["open"] = df["open"].astype("float64")
+    df["high"] = df["high"].astype("float64")
+    df["low"] = df["low"].astype("float64")
+    df["close"] = df["close"].astype("float64")
+    df["volume"] = df["volume"].astype("int64")
+    return df
+
 
 def resolve_stock_security_ids(
-    instrument_rows: List[Dict[str, str]],
+    instruments: pd.DataFrame,
     symbols: List[str],
 ) -> Dict[str, str]:
     """
@@ -81,215 +132,279 @@ def resolve_stock_security_ids(
     Returns: dict of {symbol: security_id}.
     Prints warnings for symbols that can't be found.
     """
-    # Build two lookups for NSE equity instruments:
-    #   1. UNDERLYING_SYMBOL -> security_id (primary, Dhan's trading symbol)
-    #   2. SYMBOL_NAME -> security_id (fallback, Dhan's display name)
-    underlying_to_id: Dict[str, str] = {}
-    symbol_name_to_id: Dict[str, str] = {}
-
-    for row in instrument_rows:
-        exch = (row.get("EXCH_ID") or "").upper()
-        # Use INSTRUMENT column (values: "EQUITY", "OPTSTK", etc.)
-        # instead of INSTRUMENT_TYPE (values: "ES", "OP", etc.).
-        instrument = (row.get("INSTRUMENT") or "").upper()
-
-        # Only look at NSE equity instruments.
-        if exch != "NSE":
-            continue
-        if instrument != "EQUITY":
-            continue
-
-        sid = (
-            row.get("SEM_SMST_SECURITY_ID")
-            or row.get("SecurityID")
-            or row.get("SECURITY_ID")
-        )
-        if not sid:
-            continue
-
+    # NSE equity rows that have a security ID, selected with one mask.
+    # INSTRUMENT holds "EQUITY", "OPTSTK", ... (INSTRUMENT_TYPE is "ES", "OP").
+    exch = coalesce_columns(instruments, "EXCH_ID").str.upper()
+    instrument = coalesce_columns(instruments, "INSTRUMENT").str.upper()
+    sid = coalesce_columns(
+        instruments, "SEM_SMST_SECURITY_ID", "SecurityID", "SECURITY_ID"
+    )
+    mask = (exch == "NSE") & (instrument == EQUITY) & (sid != "")
+
+    series = coalesce_columns(instruments, "SERIES", "SEM_SERIES").str.upper()
+    equities = pd.DataFrame({
+        "sid": sid[mask],
+        "UNDERLYING_SYMBOL": coalesce_columns(instruments, "UNDERLYING_SYMBOL")[mask],
+        "SYMBOL_NAME": coalesce_columns(instruments, "SYMBOL_NAME")[mask],
         # Prefer EQ series over others (e.g., SM, BE series).
-        series = (row.get("SERIES") or row.get("SEM_SERIES") or "").upper()
+        "not_eq": series[mask] != "EQ",
+    }).sort_values("not_eq", kind="mergesort")
 
-        # Primary lookup: UNDERLYING_SYMBOL (e.g., "RELIANCE", "INFY").
-        underlying = (row.get("UNDERLYING_SYMBOL") or "").strip()
-        if underlying:
-            if underlying not in underlying_to_id or series == "EQ":
-                underlying_to_id[underlying] = str(sid)
-
-        # Fallback lookup: SYMBOL_NAME (e.g., "BHEL", full display names).
-        sym_name = (row.get("SYMBOL_NAME") or "").strip()
-        if sym_name:
-            if sym_name not in symbol_name_to_id or series == "EQ":
-                symbol_name_to_id[sym_name] = str(sid)
+    def lookup(column: str) -> pd.Series:
+        """symbol -> security ID on one symbol column (EQ rows first)."""
+        keyed = equities[equities[column] != ""].drop_duplicates(column)
+        return pd.Series(keyed["sid"].to_numpy(), index=keyed[column])
 
     # Match requested symbols: try UNDERLYING_SYMBOL first, then SYMBOL_NAME.
-    result: Dict[str, str] = {}
-    missing: List[str] = []
+    wanted = pd.Series(symbols, dtype=object)
+    ids = wanted.map(lookup("UNDERLYING_SYMBOL"))
+    ids = ids.fillna(wanted.map(lookup("SYMBOL_NAME")))
 
-    for sym in symbols:
-        if sym in underlying_to_id:
-            result[sym] = underlying_to_id[sym]
-        elif sym in symbol_name_to_id:
-            result[sym] = symbol_name_to_id[sym]
-        else:
-            missing.append(sym)
+    found = ids.notna()
+    result: Dict[str, str] = dict(zip(wanted[found], ids[found].astype(str)))
+    missing: List[str] = wanted[~found].tolist()
 
     if missing:
-        print(f"  WARNING: Could not find security IDs for: {', '.join(missing)}")
-        print(f"  These stocks will be skipped.")
+        log(f"  WARNING: Could not find security IDs for: {', '.join(missing)}")
+        log(f"  These stocks will be skipped.")
 
     return result
 
 
+def _fetch_stock_window(
+    symbol: str,
+    security_id: str,
+    headers: dict,
+    window: Tuple[date, date],
+) -> Tuple[Optional[pd.DataFrame], List[Tuple[date, date]]]:
+    """
+    Fetch 1-minute candles for a single stock over one date window.
+
+    Returns (frame, halves): the window's candles (None if it failed, had
+    no data or the run was interrupted) and, if Dhan rejected the window
+    with HTTP 400, its two halves to be fetched instead. Splits are handed
+    back rather than fetched here, so a worker thread never waits on the
+    pool it runs in.
+    """
+    if STOP_EVENT.is_set():
+        return None, []
+    d_from, d_to = window
+    # Dhan reads these naive datetime strings as IST.
+    from_str = f"{d_from:%Y-%m-%d} 00:00:00"
+    to_str = f"{d_to:%Y-%m-%d} 23:59:59"
+
+    payload = {
+        "securityId": security_id,
+        "exchangeSegment": NSE_EQ,
+        "instrument": EQUITY,
+        "interval": "1",
+        "oi": False,
+        "fromDate": from_str,
+        "toDate": to_str,
+    }
+
+    try:
+        data = post_json(INTRADAY_URL, payload, headers)
+    except RuntimeError as e:
+        # If HTTP 400 for a large window, try splitting.
+        if "HTTP 400" in str(e) and (d_to - d_from).days > 1:
+            mid = d_from + (d_to - d_from) // 2
+            return None, [(d_from, mid), (mid, d_to)]
+        # For other errors, skip this window and continue.
+        log(f"    Error for {symbol} window {d_from}->{d_to}: {e}")
+        return None, []
+
+    timestamps = data.get("timestamp") or []
+    if not timestamps:
+        return None, []
+
+    # Build one columnar frame per window from the API's arrays; short
+    # value arrays are padded (OHLC with 0.0, volume with 0) up front.
+    n = len(timestamps)
+    ts = np.asarray(timestamps, dtype=np.int64)
+    return pd.DataFrame({
+        "ts": ts,
+        "open": pad_array(data.get("open"), n, 0.0),
+        "high": pad_array(data.get("high"), n, 0.0),
+        "low": pad_array(data.get("low"), n, 0.0),
+        "close": pad_array(data.get("close"), n, 0.0),
+        "volume": pad_array(data.get("volume"), n, 0, dtype=np.int64),
+    }), []
+
+
+def _fetch_stock_frames(
+    symbol: str,
+    security_id: str,
+    headers: dict,
+    start_date,
+    end_date,
+    pool: ThreadPoolExecutor,
+) -> List[pd.DataFrame]:
+    """
+    Fetch all 90-day windows of a date range as a flat list of frames.
+
+    The windows are independent, so they are submitted to pool side by
+    side, and the halves of a rejected window are submitted to the same
+    pool; post_json's rate limiter keeps the call rate within Dhan's quota.
+    Frames are returned in window order.
+    """
+    fetch_window = partial(_fetch_stock_window, symbol, security_id, headers)
+    pending = {
+        pool.submit(fetch_window, window): window
+        for window in generate_date_windows(start_date, end_date, max_days=90)
+    }
+
+    frames: Dict[Tuple[date, date], pd.DataFrame] = {}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            window = pending.pop(future)
+            frame, halves = future.result()
+            if frame is not None:
+                frames[window] = frame
+            for half in halves:
+                pending[pool.submit(fetch_window, half)] = half
+
+    # Windows skipped after an interrupt would leave a gap in the stock.
+    check_stop()
+    return [frames[window] for window in sorted(frames)]
+
+
 def fetch_stock_data(
     symbol: str,
     security_id: str,
     headers: dict,
     start_date,
     end_date,
+    pool: Optional[ThreadPoolExecutor] = None,
 ) -> pd.DataFrame:
     """
     Fetch 1-minute candles for a single stock.
 
     Returns DataFrame with standard columns.
-    Uses 90-day windows as required by Dhan.
+    Uses 90-day windows as required by Dhan, fetched concurrently on pool
+    (run_stocks_fetch shares one across all stocks); without one, a pool
+    of API_MAX_WORKERS threads is used for this call.
     """
-    windows = generate_date_windows(start_date, end_date, max_days=90)
-    all_rows = []
-
-    for w_idx, (d_from, d_to) in enumerate(windows, start=1):
-        from_str = datetime(
-            d_from.year, d_from.month, d_from.day, 0, 0, 0, tzinfo=IST
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        to_str = datetime(
-            d_to.year, d_to.month, d_to.day, 23, 59, 59, tzinfo=IST
-        ).strftime("%Y-%m-%d %H:%M:%S")
-
-        payload = {
-            "securityId": security_id,
-            "exchangeSegment": NSE_EQ,
-            "instrument": EQUITY,
-            "interval": "1",
-            "oi": False,
-            "fromDate": from_str,
-            "toDate": to_str,
-        }
+    if pool is None:
+        with worker_pool(API_MAX_WORKERS) as own_pool:
+            return fetch_stock_data(
+                symbol, security_id, headers, start_date, end_date, own_pool
+            )
 
-        try:
-            data = post_json(INTRADAY_URL, payload, headers)
-        except RuntimeError as e:
-            # If HTTP 400 for a large window, try splitting.
-            if "HTTP 400" in str(e) and (d_to - d_from).days > 1:
-                mid = d_from + (d_to - d_from) // 2
-                df_left = fetch_stock_data(symbol, security_id, headers, d_from, mid)
-                df_right = fetch_stock_data(symbol, security_id, headers, mid, d_to)
-                all_rows.append(df_left)
-                all_rows.append(df_right)
-                continue
-            # For other errors, skip this window and continue.
-            print(f"    Error for {symbol} window {d_from}->{d_to}: {e}")
-            continue
-
-        timestamps = data.get("timestamp") or []
-        if not timestamps:
-            continue
-
-        opens = data.get("open") or []
-        highs = data.get("high") or []
-        lows = data.get("low") or []
-        closes = data.get("close") or []
-        volumes = data.get("volume") or []
-
-        n = len(timestamps)
-        if len(volumes) < n:
-            volumes = volumes + [0] * (n - len(volumes))
-
-        for i in range(n):
-            ts = int(timestamps[i])
-            all_rows.append({
-                "ts": ts,
-                "datetime": epoch_to_ist_iso(ts),
-                "open": float(opens[i]) if i < len(opens) else 0.0,
-                "high": float(highs[i]) if i < len(highs) else 0.0,
-                "low": float(lows[i]) if i < len(lows) else 0.0,
-                "close": float(closes[i]) if i < len(closes) else 0.0,
-                "volume": int(volumes[i]),
-            })
-
-        throttle()
-
-    # Combine dicts and any sub-DataFrames from recursive splits.
-    dicts = [r for r in all_rows if isinstance(r, dict)]
-    dfs = [r for r in all_rows if isinstance(r, pd.DataFrame)]
-
-    df = pd.DataFrame(dicts) if dicts else pd.DataFrame()
-    for sub_df in dfs:
-        df = pd.concat([df, sub_df], ignore_index=True)
+    frames = _fetch_stock_frames(
+        symbol, security_id, headers, start_date, end_date, pool
+    )
+    # Single concat of all window frames (including split sub-frames).
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
-    return df
+
+def _fetch_one_stock(
+    symbol: str,
+    sec_id: str,
+    headers: dict,
+    end: date,
+    window_pool: ThreadPoolExecutor,
+) -> None:
+    """
+    Fetch and save 1-min data for one stock (one worker's job).
+
+    Resumes from the last stored candle and appends only the new candles
+    as a part file; stored data is rewritten only by compaction.
+    """
+    out_dir = os.path.join(STOCKS_DIR, symbol)
+
+    # Older runs kept each stock in one {SYMBOL}_1m.parquet; it becomes
+    # the first part (rebuilding datetime, which was once an ISO string).
+    legacy_file = os.path.join(out_dir, f"{symbol}_1m.parquet")
+    legacy_df = load_parquet(legacy_file)
+    if legacy_df is not None:
+        log(f"  Migrating {legacy_file} to part files...")
+        if not legacy_df.empty:
+            legacy_df = merge_and_deduplicate(None, legacy_df, STOCK_DEDUP_COLS)
+            append_part(
+                _enforce_types(legacy_df), out_dir, STOCK_SCHEMA, quiet=True
+            )
+        os.remove(legacy_file)
+
+    # Determine start date (incremental update).
+    start = STOCKS_START_DATE
+    last_ts = get_last_timestamp(out_dir)
+    if last_ts is not None:
+        last_dt = datetime.fromtimestamp(last_ts, tz=IST)
+        start = last_dt.date()
+        log(f"  {symbol}: resuming from {start} (incremental)")
+
+    if start >= end:
+        log(f"  {symbol}: already up to date.")
+        return
+
+    new_df = fetch_stock_data(symbol, sec_id, headers, start, end, window_pool)
+
+    # Parts never overlap: keep only candles after the last stored one.
+    if last_ts is not None and not new_df.empty:
+        new_df = new_df[new_df["ts"] > last_ts]
+
+    if new_df.empty:
+        log(f"  No new data for {symbol}.")
+        return
+
+    # Split windows can overlap by a day; dedup and sort the new rows only.
+    new_df = merge_and_deduplicate(None, new_df, STOCK_DEDUP_COLS)
+    append_part(_enforce_types(new_df), out_dir, STOCK_SCHEMA)
+
+    if len(list_parts(out_dir)) > STOCK_COMPACT_PARTS:
+        compact_parts(out_dir, STOCK_DEDUP_COLS, STOCK_SCHEMA)
 
 
 def run_stocks_fetch() -> None:
     """
     Main entry point: fetch 1-min data for all Nifty 100 stocks.
 
-    Processes stocks one by one, saving each to its own Parquet file.
+    Stocks are independent, so up to STOCK_MAX_WORKERS of them are
+    fetched side by side, each saved to its own Parquet file. All their
+    windows share one pool of API_MAX_WORKERS threads, which bounds the
+    requests in flight for the whole run. A failing stock is reported and
+    does not stop the others.
     Supports incremental updates per stock.
     """
     ensure_dir(STOCKS_DIR)
 
-    print("Downloading Dhan instrument list...")
-    instrument_rows = load_instrument_list()
-    print(f"  Loaded {len(instrument_rows)} instrument rows.")
+    log("Loading Dhan instrument list (cached for a day)...")
+    instruments = load_instrument_list()
+    log(f"  Loaded {len(instruments)} instrument rows.")
 
     # Resolve security IDs for all Nifty 100 symbols.
-    print(f"  Resolving security IDs for {len(NIFTY_100_SYMBOLS)} stocks...")
-    sym_to_id = resolve_stock_security_ids(instrument_rows, NIFTY_100_SYMBOLS)
-    print(f"  Found {len(sym_to_id)} stocks with valid security IDs.")
+    log(f"  Resolving security IDs for {len(NIFTY_100_SYMBOLS)} stocks...")
+    sym_to_id = resolve_stock_security_ids(instruments, NIFTY_100_SYMBOLS)
+    log(f"  Found {len(sym_to_id)} stocks with valid security IDs.")
 
     headers = build_auth_headers()
     total = len(sym_to_id)
     end = today_ist()
 
-    for idx, (symbol, sec_id) in enumerate(sorted(sym_to_id.items()), start=1):
-        out_dir = os.path.join(STOCKS_DIR, symbol)
-        out_file = os.path.join(out_dir, f"{symbol}_1m.parquet")
-
-        print(f"\n[{idx}/{total}] {symbol} (securityId={sec_id})")
-
-        # Determine start date (incremental update).
-        start = STOCKS_START_DATE
-        existing_df = load_parquet(out_file)
-        last_ts = get_last_timestamp(out_file)
-        if last_ts is not None:
-            last_dt = datetime.fromtimestamp(last_ts, tz=IST)
-            start = last_dt.date()
-            print(f"  Resuming from {start} (incremental)")
-
-        if start >= end:
-            print(f"  Already up to date.")
-            continue
-
-        new_df = fetch_stock_data(symbol, sec_id, headers, start, end)
-
-        if new_df.empty:
-            print(f"  No data returned for {symbol}.")
-            continue
-
-        # Merge and deduplicate.
-        final_df = merge_and_deduplicate(existing_df, new_df, STOCK_DEDUP_COLS)
-
-        # Enforce column types.
-        final_df["ts"] = final_df["ts"].astype("int64")
-        final_df["open"] = final_df["open"].astype("float64")
-        final_df["high"] = final_df["high"].astype("float64")
-        final_df["low"] = final_df["low"].astype("float64")
-        final_df["close"] = final_df["close"].astype("float64")
-        final_df["volume"] = final_df["volume"].astype("int64")
-
-        save_parquet(final_df, out_file)
-
-    print(f"\nStocks data fetch complete. Processed {total} stocks.")
+    failed: List[str] = []
+    with worker_pool(API_MAX_WORKERS) as window_pool, \
+            worker_pool(STOCK_MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(
+                _fetch_one_stock, symbol, sec_id, headers, end, window_pool
+            ): symbol
+            for symbol, sec_id in sorted(sym_to_id.items())
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            check_stop()
+            symbol = futures[future]
+            try:
+                future.result()
+            except Exception as exc:
+                failed.append(symbol)
+                log(f"  ERROR for {symbol}: {exc}")
+            log(f"[{done}/{total}] {symbol} done")
+
+    if failed:
+        log(f"\n  WARNING: {len(failed)} stocks failed: {', '.join(sorted(failed))}")
+    log(f"\nStocks data fetch complete. Processed {total} stocks.")
 
 
 if __name__ == "__main__":
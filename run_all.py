@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 """
-Run all data fetchers in sequence.
+Run all data fetchers side by side.
 
 This is the main entry point for the data collection pipeline.
 It runs:
@@ -9,6 +9,12 @@ It runs:
     2. Options data (NIFTY + SENSEX, 1 year, ~2-4 hours)
     3. Nifty 100 stocks (3 years, ~20-30 min)
 
+The fetchers share no files, so they run concurrently in threads; the
+total time is roughly that of the options fetch. Every API call also
+waits for one shared limiter (config.API_GLOBAL_RATE_LIMIT), so running
+them together does not exceed Dhan's quotas. Each output line is prefixed with the fetcher that
+printed it, e.g. "[stocks] ...".
+
 Each fetcher supports incremental updates, so re-running is safe
 and will only fetch new data since the last run.
 
@@ -22,42 +28,46 @@ Usage:
 
 import sys
 import time
+from concurrent.futures import as_completed
+
+from utils import log, set_log_tag, worker_pool
 
 
 def run_spot():
     """Run the spot index data fetcher."""
-    print("=" * 60)
-    print("STEP 1: Fetching spot index data (NIFTY + SENSEX)")
-    print("=" * 60)
+    log("Fetching spot index data (NIFTY + SENSEX)")
     from fetch_index_intraday import run_spot_fetch
     run_spot_fetch()
 
 
 def run_options():
     """Run the options data fetcher."""
-    print("=" * 60)
-    print("STEP 2: Fetching options data (NIFTY + SENSEX)")
-    print("  This takes a long time (~2-4 hours) due to many API calls.")
-    print("=" * 60)
+    log("Fetching options data (NIFTY + SENSEX)")
+    log("  This takes a long time (~2-4 hours) due to many API calls.")
     from fetch_options_rolling import run_options_fetch
     run_options_fetch()
 
 
 def run_stocks():
     """Run the Nifty 100 stocks data fetcher."""
-    print("=" * 60)
-    print("STEP 3: Fetching Nifty 100 stocks data")
-    print("=" * 60)
+    log("Fetching Nifty 100 stocks data")
     from fetch_stocks import run_stocks_fetch
     run_stocks_fetch()
 
 
+def _run_step(name, step):
+    """Run one fetcher with its output tagged "[name]" (see utils.log)."""
+    set_log_tag(name)
+    step()
+
+
 def main():
     """
     Run all fetchers, or a specific one if given as argument.
 
     Accepted arguments: spot, options, stocks.
-    No argument = run all three in order.
+    No argument = run all three. Selected fetchers run concurrently; the
+    first one to fail raises once the others have finished.
     """
     start = time.time()
 
@@ -65,14 +75,24 @@ def main():
     args = [a.lower() for a in sys.argv[1:]]
     run_all = len(args) == 0
 
+    steps = {}
     if run_all or "spot" in args:
-        run_spot()
+        steps["spot"] = run_spot
 
     if run_all or "options" in args:
-        run_options()
+        steps["options"] = run_options
 
     if run_all or "stocks" in args:
-        run_stocks()
+        steps["stocks"] = run_stocks
+
+    if steps:
+        with worker_pool(len(steps)) as pool:
+            futures = [
+                pool.submit(_run_step, name, step)
+                for name, step in steps.items()
+            ]
+            for future in as_completed(futures):
+                future.result()
 
     elapsed = time.time() - start
     minutes = int(elapsed // 60)
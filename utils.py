@@ -12,22 +12,38 @@ Contains all reusable functions:
 """
 
 import csv
-import io
-import json
+import glob
 import os
-import ssl
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional, Tuple
-
-from urllib import request as urlrequest
-from urllib.error import HTTPError, URLError
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
+import orjson
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
-
-from config import API_CALL_DELAY, DHAN_BASE_URL, INSTRUMENT_LIST_URL
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    API_GLOBAL_RATE_LIMIT,
+    API_RATE_LIMITS,
+    DEFAULT_RATE_LIMIT,
+    DHAN_BASE_URL,
+    HTTP_POOL_SIZE,
+    INSTRUMENT_CACHE_PATH,
+    INSTRUMENT_CACHE_TTL,
+    INSTRUMENT_LIST_URL,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -36,6 +52,7 @@ from config import API_CALL_DELAY, DHAN_BASE_URL, INSTRUMENT_LIST_URL
 
 # IST is UTC+5:30. We use a fixed offset so it works everywhere.
 IST = timezone(timedelta(hours=5, minutes=30))
+IST_OFFSET_SECONDS = 5 * 3600 + 30 * 60
 
 
 def now_ist() -> datetime:
@@ -76,14 +93,110 @@ def build_auth_headers() -> Dict[str, str]:
     return {
         "Accept": "application/json",
         "Content-Type": "application/json",
+        "Connection": "keep-alive",
         "access-token": token,
     }
 
 
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """
+    Thread-safe token bucket.
+
+    Holds up to `burst` tokens, refilled continuously at `rate_per_sec`.
+    acquire() takes one token and only sleeps when the bucket is empty,
+    for exactly as long as it takes the next token to arrive.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int = 1) -> None:
+        self._rate = float(rate_per_sec)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._last) * self._rate
+            )
+            self._last = now
+            # Reserve a token now; a negative balance is our place in line.
+            wait = (1.0 - self._tokens) / self._rate
+            self._tokens -= 1.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+# One shared limiter per endpoint path (see API_RATE_LIMITS).
+_RATE_LIMITERS = {
+    path: RateLimiter(rate, burst)
+    for path, (rate, burst) in API_RATE_LIMITS.items()
+}
+_DEFAULT_LIMITER = RateLimiter(*DEFAULT_RATE_LIMIT)
+
+# One limiter for all Dhan calls together (see API_GLOBAL_RATE_LIMIT).
+_GLOBAL_LIMITER = RateLimiter(*API_GLOBAL_RATE_LIMIT)
+
+
+def get_rate_limiter(url: str) -> RateLimiter:
+    """Return the shared RateLimiter for the endpoint `url` points at."""
+    for path, limiter in _RATE_LIMITERS.items():
+        if url.endswith(path):
+            return limiter
+    return _DEFAULT_LIMITER
+
+
 # ---------------------------------------------------------------------------
 # HTTP helper
 # ---------------------------------------------------------------------------
 
+# Retries for transient failures, with exponential backoff between them.
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5
+
+
+def _build_session() -> requests.Session:
+    """
+    Create the shared HTTP session used for every Dhan API call.
+
+    One pooled session keeps TCP+TLS connections alive across calls
+    instead of paying a fresh handshake per request. Transient 5xx
+    failures are retried with exponential backoff by the adapter; 429 is
+    retried by post_json, so those retries wait for the rate limiters.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=[500, 502, 503, 504],
+        # Dhan's chart endpoints are read-only queries, so POST is safe to retry.
+        allowed_methods=None,
+        # Hand the final response back so post_json can report Dhan's error.
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared, thread-safe session (see _build_session).
+_SESSION = _build_session()
+
+# We disable SSL verification (see post_json); silence the per-call warning.
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
 def post_json(
     url: str,
     payload: Dict[str, Any],
@@ -93,36 +206,50 @@ def post_json(
     """
     POST JSON to Dhan API and return decoded JSON response.
 
+    Blocks on the endpoint's RateLimiter and the global one first, so
+    callers never need to sleep between calls themselves; a 429 answer is
+    retried (with backoff) through the same limiters. Reuses pooled
+    keep-alive connections from the shared session.
+
     Handles Dhan's structured error responses:
     - DH-905 / DH-907 with "no data" -> returns empty dict (not fatal).
 
     NOTE: SSL verification is disabled due to cert issues in user's env.
     In production, fix system certificates instead.
     """
-    body = json.dumps(payload).encode("utf-8")
+    body = orjson.dumps(payload)
     req_headers = {
         "Accept": headers.get("Accept", "application/json"),
         "Content-Type": headers.get("Content-Type", "application/json"),
+        "Connection": headers.get("Connection", "keep-alive"),
         "access-token": headers["access-token"],
     }
 
-    ctx = ssl._create_unverified_context()
-    req = urlrequest.Request(url, data=body, headers=req_headers, method="POST")
-
-    try:
-        with urlrequest.urlopen(req, timeout=timeout, context=ctx) as resp:
-            resp_bytes = resp.read()
-    except HTTPError as e:
-        # Read error body for debugging.
+    limiter = get_rate_limiter(url)
+    for attempt in range(HTTP_RETRIES + 1):
+        limiter.acquire()
+        _GLOBAL_LIMITER.acquire()
         try:
-            err_body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            err_body = ""
+            resp = _SESSION.post(
+                url, data=body, headers=req_headers, timeout=timeout, verify=False
+            )
+        except requests.RequestException as e:
+            raise RuntimeError(f"Network error calling Dhan: {e}") from e
+        if resp.status_code != 429 or attempt == HTTP_RETRIES:
+            break
+        # Throttled: back off, then queue for a token like a new call.
+        time.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
+
+    if resp.status_code >= 400:
+        # Read error body for debugging.
+        err_body = resp.content.decode("utf-8", errors="replace")
 
         try:
-            parsed = json.loads(err_body) if err_body else {}
+            parsed = orjson.loads(resp.content) if resp.content else {}
         except Exception:
             parsed = {}
+        if not isinstance(parsed, dict):
+            parsed = {}
 
         error_code = str(parsed.get("errorCode") or "")
         error_message = str(parsed.get("errorMessage") or "").lower()
@@ -132,96 +259,221 @@ def post_json(
             return {}
 
         raise RuntimeError(
-            f"HTTP {e.code} from Dhan. Body={err_body.strip()}"
-        ) from e
-    except URLError as e:
-        raise RuntimeError(f"Network error calling Dhan: {e}") from e
+            f"HTTP {resp.status_code} from Dhan. Body={err_body.strip()}"
+        )
 
+    # orjson parses the raw bytes directly (large numeric arrays decode
+    # several times faster than with the stdlib json module).
     try:
-        return json.loads(resp_bytes.decode("utf-8"))
-    except json.JSONDecodeError as e:
+        return orjson.loads(resp.content)
+    except orjson.JSONDecodeError as e:
         raise RuntimeError(f"Failed to decode JSON from Dhan: {e}") from e
 
 
-def throttle() -> None:
-    """Sleep briefly between API calls to respect rate limits."""
-    time.sleep(API_CALL_DELAY)
-
-
 # ---------------------------------------------------------------------------
 # Instrument list loading
 # ---------------------------------------------------------------------------
 
-def load_instrument_list(url: str = INSTRUMENT_LIST_URL) -> List[Dict[str, str]]:
+# Instrument-list columns the resolvers read, in every spelling Dhan has
+# used. Only these are parsed and cached; the full CSV has ~20 columns.
+_INSTRUMENT_COLUMNS = frozenset({
+    "EXCH_ID", "ExchangeId",
+    "INSTRUMENT", "INSTRUMENT_TYPE", "InstrumentType",
+    "SEM_SMST_SECURITY_ID", "SecurityID", "SECURITY_ID",
+    "SERIES", "SEM_SERIES",
+    "UNDERLYING_SYMBOL",
+    "SYMBOL_NAME", "SymbolName",
+    "DISPLAY_NAME", "DisplayName",
+})
+
+
+def _parse_instrument_csv(stream: Any) -> pd.DataFrame:
+    """
+    Parse the instrument list CSV with PyArrow's multi-threaded C++ reader.
+
+    stream is a binary file object positioned at the header line (e.g. the
+    raw HTTP response); Arrow reads it in blocks, so the body is parsed as
+    it arrives instead of being buffered whole first.
+
+    Only the _INSTRUMENT_COLUMNS present in the header are kept. They are
+    read as strings (IDs keep their exact text), keys and values are
+    stripped of whitespace and missing values stay "".
+    """
+    # Declare the kept columns as string up front instead of letting Arrow
+    # infer types; the header line gives the column names.
+    header = next(csv.reader([stream.readline().decode("utf-8-sig")]), [])
+    keep = [name for name in header if name.strip() in _INSTRUMENT_COLUMNS]
+    table = pacsv.read_csv(
+        pa.PythonFile(stream, mode="r"),
+        read_options=pacsv.ReadOptions(use_threads=True, column_names=header),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in keep},
+            include_columns=keep,
+            strings_can_be_null=False,
+        ),
+    )
+    table = pa.table({
+        name.strip(): pc.utf8_trim_whitespace(col)
+        for name, col in zip(table.column_names, table.columns)
+    })
+    return table.to_pandas()
+
+
+def _download_instrument_list(
+    url: str,
+    etag: Optional[str] = None,
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
     """
     Download and parse Dhan's detailed instrument list CSV.
 
-    Returns a list of dicts, one per instrument row.
-    Keys are stripped of whitespace.
+    Sends If-None-Match when an etag is given; returns (None, etag) if the
+    server answers 304 Not Modified. Otherwise returns (df, new_etag),
+    parsed by _parse_instrument_csv.
     """
-    ctx = ssl._create_unverified_context()
+    req_headers = {"If-None-Match": etag} if etag else {}
     try:
-        with urlrequest.urlopen(url, timeout=120, context=ctx) as resp:
-            text_stream = io.TextIOWrapper(resp, encoding="utf-8")
-            reader = csv.DictReader(text_stream)
-            rows = []
-            for row in reader:
-                cleaned = {
-                    (k.strip() if isinstance(k, str) else k): (
-                        v.strip() if isinstance(v, str) else v
-                    )
-                    for k, v in row.items()
-                }
-                rows.append(cleaned)
-            return rows
-    except (HTTPError, URLError) as e:
+        # Fetched through the shared session (pooled connection, retries)
+        # and streamed straight from the socket into the parser.
+        with _SESSION.get(
+            url, headers=req_headers, timeout=120, verify=False, stream=True
+        ) as resp:
+            if resp.status_code == 304:
+                return None, etag
+            resp.raise_for_status()
+            resp.raw.decode_content = True  # undo gzip transfer encoding
+            return _parse_instrument_csv(resp.raw), resp.headers.get("ETag")
+    except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+        # urllib3 errors surface directly when the body fails mid-stream.
         raise RuntimeError(f"Failed to download instrument list: {e}") from e
 
 
+@lru_cache(maxsize=1)
+def _read_instrument_cache(cache_path: str, mtime: float) -> pd.DataFrame:
+    """
+    Read the cached instrument list (memoized per file version).
+
+    mtime is part of the cache key, so a refreshed file is re-read while
+    repeated calls in one process (e.g. run_all.py) parse it only once.
+    Callers share the returned DataFrame and must not modify it.
+    """
+    # Caches written by older versions hold every CSV column.
+    columns = [
+        name for name in pq.read_schema(cache_path).names
+        if name in _INSTRUMENT_COLUMNS
+    ]
+    return pd.read_parquet(cache_path, columns=columns)
+
+
+# One download at a time, even if several fetchers start together.
+_INSTRUMENT_LOCK = threading.Lock()
+
+
+def load_instrument_list(
+    url: str = INSTRUMENT_LIST_URL,
+    cache_path: str = INSTRUMENT_CACHE_PATH,
+    max_age: float = INSTRUMENT_CACHE_TTL,
+) -> pd.DataFrame:
+    """
+    Load Dhan's detailed instrument list, downloading it at most once per max_age.
+
+    The parsed list is cached as Parquet at cache_path. A cache younger
+    than max_age seconds is read back instead of re-downloading the CSV.
+    A stale cache is revalidated with the ETag stored next to it: if Dhan
+    answers 304 Not Modified, the cache is kept for another max_age.
+
+    Returns a DataFrame with one row per instrument, holding only the
+    columns the resolvers use (_INSTRUMENT_COLUMNS), every value as a
+    string. Column names are stripped of whitespace; missing values are "".
+    """
+    etag_path = cache_path + ".etag"
+    with _INSTRUMENT_LOCK:
+        cached = os.path.exists(cache_path)
+        if not cached or time.time() - os.path.getmtime(cache_path) >= max_age:
+            etag = None
+            if cached and os.path.exists(etag_path):
+                with open(etag_path, encoding="utf-8") as f:
+                    etag = f.read().strip() or None
+
+            df, etag = _download_instrument_list(url, etag)
+            if df is None:
+                # 304: the cached copy is still current.
+                os.utime(cache_path)
+            elif df.empty:
+                return df
+            else:
+                save_parquet(df, cache_path, quiet=True)
+                if etag:
+                    with open(etag_path, "w", encoding="utf-8") as f:
+                        f.write(etag)
+                elif os.path.exists(etag_path):
+                    os.remove(etag_path)
+
+        return _read_instrument_cache(cache_path, os.path.getmtime(cache_path))
+
+
 # ---------------------------------------------------------------------------
 # Index instrument resolution
 # ---------------------------------------------------------------------------
 
 def _matches_keywords(text: str, includes: List[str], excludes: List[str]) -> bool:
-    """Check if text matches include keywords and none of the exclude keywords."""
-    upper = text.upper()
-    if includes and not any(inc.upper() in upper for inc in includes):
+    """
+    Check if text matches include keywords and none of the exclude keywords.
+
+    All arguments must already be uppercased (done once by the caller).
+    """
+    if includes and not any(inc in text for inc in includes):
         return False
-    if any(exc.upper() in upper for exc in excludes):
+    if any(exc in text for exc in excludes):
         return False
     return True
 
 
+def coalesce_columns(df: pd.DataFrame, *names: str) -> pd.Series:
+    """
+    Row-wise first non-empty value among the named columns.
+
+    Dhan has used several spellings for some instrument-list columns
+    (e.g. SEM_SMST_SECURITY_ID / SecurityID); missing columns are
+    skipped, and rows with no value in any of them get "".
+    """
+    out = pd.Series("", index=df.index, dtype=object)
+    for name in reversed(names):
+        if name in df.columns:
+            col = df[name]
+            out = col.where(col != "", out)
+    return out
+
+
 def resolve_index_instrument(
-    rows: Iterable[Dict[str, str]],
+    instruments: pd.DataFrame,
     name: str,
     match_rules: Dict[str, Any],
 ) -> Dict[str, str]:
     """
     Find the best matching INDEX instrument row for a given index name.
 
-    Returns the raw instrument dict with the highest match score.
+    Returns the raw instrument row (as a dict) with the highest match score.
     """
+    # Uppercase the keywords once, not once per row.
     rules = match_rules[name]
-    preferred = rules["preferred_keywords"]
-    fallback = rules["fallback_keywords"]
-    excludes = rules["exclude_keywords"]
+    preferred = [k.upper() for k in rules["preferred_keywords"]]
+    fallback = [k.upper() for k in rules["fallback_keywords"]]
+    excludes = [k.upper() for k in rules["exclude_keywords"]]
 
     # Preferred exchange for each index.
     preferred_exch = "NSE" if name == "NIFTY_50" else "BSE"
 
     candidates: List[Tuple[Dict[str, str], int]] = []
 
-    for row in rows:
-        instr_type = (
-            row.get("INSTRUMENT_TYPE") or row.get("InstrumentType") or ""
-        ).upper()
-        if instr_type != "INDEX":
-            continue
+    # Only the few hundred INDEX rows need keyword scoring; pick them out
+    # with one vectorized mask instead of walking every instrument.
+    instr_type = coalesce_columns(instruments, "INSTRUMENT_TYPE", "InstrumentType")
+    index_rows = instruments[instr_type.str.upper() == "INDEX"]
 
+    for row in index_rows.to_dict("records"):
         symbol = row.get("SYMBOL_NAME") or row.get("SymbolName") or ""
         display = row.get("DISPLAY_NAME") or row.get("DisplayName") or ""
-        combined = f"{symbol} {display}".strip()
+        combined = f"{symbol} {display}".strip().upper()
         if not combined:
             continue
 
@@ -287,37 +539,214 @@ def generate_date_windows(
 # Parquet I/O with incremental update support
 # ---------------------------------------------------------------------------
 
-def save_parquet(df: pd.DataFrame, filepath: str) -> None:
+# Parquet writer settings: ZSTD level 3 compresses OHLC data much better
+# than Snappy at similar read speed. Row groups of 128k rows (about a year
+# of one stock's minute candles) keep the tail read in get_last_timestamp
+# small, and per-column min/max statistics let readers skip row groups.
+PARQUET_COMPRESSION = "zstd"
+PARQUET_COMPRESSION_LEVEL = 3
+PARQUET_DATA_PAGE_SIZE = 1 << 20
+PARQUET_ROW_GROUP_SIZE = 128 * 1024
+
+
+def save_parquet(
+    df: pd.DataFrame,
+    filepath: str,
+    schema: Optional[pa.Schema] = None,
+    quiet: bool = False,
+) -> None:
     """
-    Save a DataFrame to Parquet with Snappy compression.
+    Save a DataFrame to Parquet with ZSTD compression, using PyArrow directly.
 
-    Creates parent directories if needed.
+    If schema is given, columns are converted to it on the way in, so
+    low-cardinality string columns declared as pa.dictionary(...) are
+    stored dictionary-encoded and read back as pandas categoricals.
+
+    Creates parent directories if needed. Writes to a hidden temp file
+    first and renames it into place, so readers never see a partial file.
     """
-    ensure_dir(os.path.dirname(filepath))
-    df.to_parquet(filepath, engine="pyarrow", compression="snappy", index=False)
-    print(f"  Saved {len(df)} rows to {filepath}")
+    dirname = os.path.dirname(filepath)
+    ensure_dir(dirname)
+    tmp_path = os.path.join(dirname, f".{os.path.basename(filepath)}.tmp")
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    pq.write_table(
+        table,
+        tmp_path,
+        compression=PARQUET_COMPRESSION,
+        compression_level=PARQUET_COMPRESSION_LEVEL,
+        use_dictionary=True,
+        data_page_size=PARQUET_DATA_PAGE_SIZE,
+        row_group_size=PARQUET_ROW_GROUP_SIZE,
+        write_statistics=True,
+    )
+    os.replace(tmp_path, filepath)
+    if not quiet:
+        log(f"  Saved {len(df)} rows to {filepath}")
 
 
 def load_parquet(filepath: str) -> Optional[pd.DataFrame]:
     """
-    Load a Parquet file if it exists. Returns None if file doesn't exist.
+    Load a Parquet file or partitioned dataset directory if it exists.
+
+    Returns None if nothing exists at filepath. Hive partition keys of a
+    dataset directory (e.g. 'date') come back as columns.
     """
     if not os.path.exists(filepath):
         return None
     return pd.read_parquet(filepath, engine="pyarrow")
 
 
+def _last_ts_in_file(filepath: str) -> Optional[int]:
+    """
+    Max 'ts' of a Parquet file written by this pipeline (sorted by ts).
+
+    Only the last row group is consulted: its column statistics if they
+    were written, otherwise just its 'ts' column is read.
+    """
+    pf = pq.ParquetFile(filepath)
+    n_groups = pf.metadata.num_row_groups
+    if n_groups == 0:
+        return None
+    last_group = pf.metadata.row_group(n_groups - 1)
+    if last_group.num_rows == 0:
+        return None
+
+    ts_idx = pf.schema_arrow.get_field_index("ts")
+    stats = last_group.column(ts_idx).statistics
+    if stats is not None and stats.has_min_max:
+        return int(stats.max)
+    ts = pf.read_row_group(n_groups - 1, columns=["ts"])["ts"]
+    return int(pc.max(ts).as_py())
+
+
 def get_last_timestamp(filepath: str) -> Optional[int]:
     """
-    Read the last 'ts' value from an existing Parquet file.
+    Read the last 'ts' value from an existing Parquet file or dataset.
 
-    Returns None if the file doesn't exist or is empty.
+    Only the tail of the data is looked at: the last row group of a
+    single file, of the newest day's partition(s) of a date-partitioned
+    dataset directory, or of each file in a directory of parts.
+    Returns None if nothing exists or it is empty.
     Used for incremental updates: resume fetching from this point.
     """
-    df = load_parquet(filepath)
-    if df is None or df.empty:
+    if os.path.isdir(filepath):
+        files = _latest_partition_files(filepath) or glob.glob(
+            os.path.join(filepath, "*.parquet")
+        )
+    elif os.path.exists(filepath):
+        files = [filepath]
+    else:
         return None
-    return int(df["ts"].max())
+
+    values = [ts for ts in map(_last_ts_in_file, files) if ts is not None]
+    return max(values) if values else None
+
+
+# ---------------------------------------------------------------------------
+# Date-partitioned datasets
+#
+# Layout: <root>/date=YYYY-MM-DD/part.parquet, one file per IST trading
+# day (Hive-style, so pyarrow/pandas readers discover 'date' as a column).
+# An incremental run only rewrites the days it actually fetched.
+#
+# Datasets may also be sharded by a few low-cardinality columns above the
+# day level, e.g. <root>/expiry_type=WEEK/expiry_code=1/date=.../. Shard
+# columns live only in the path (readers get them back as columns), so
+# they are dropped from the files themselves.
+# ---------------------------------------------------------------------------
+
+PARTITION_FILE = "part.parquet"
+
+
+def ist_dates(epoch_seconds: Iterable[int]) -> np.ndarray:
+    """Return the IST calendar day ("YYYY-MM-DD") of each epoch timestamp."""
+    ts = np.asarray(epoch_seconds, dtype=np.int64) + IST_OFFSET_SECONDS
+    days = (ts // 86400).astype("datetime64[D]")
+    return np.datetime_as_string(days, unit="D")
+
+
+def partition_path(
+    root: str,
+    day: str,
+    shard: Iterable[Tuple[str, Any]] = (),
+) -> str:
+    """Path of the partition file holding one IST day (of one shard) under root."""
+    dirs = [f"{col}={value}" for col, value in shard]
+    return os.path.join(root, *dirs, f"date={day}", PARTITION_FILE)
+
+
+def _latest_partition_files(root: str) -> List[str]:
+    """Partition files of the newest day under root (empty if none)."""
+    pattern = os.path.join(root, "**", "date=*", PARTITION_FILE)
+    files = glob.glob(pattern, recursive=True)
+    if not files:
+        return []
+
+    def day_of(path: str) -> str:
+        return os.path.basename(os.path.dirname(path))
+
+    latest = max(day_of(f) for f in files)
+    return [f for f in files if day_of(f) == latest]
+
+
+def save_partitioned(
+    df: pd.DataFrame,
+    root: str,
+    dedup_columns: List[str],
+    schema: Optional[pa.Schema] = None,
+    shard_columns: Tuple[str, ...] = (),
+) -> None:
+    """
+    Save a DataFrame into daily partitions under root.
+
+    Rows are grouped by shard_columns (if any) and IST day of 'ts'. Each
+    touched partition is merged with its existing file (new data wins)
+    and rewritten; all other partitions are left alone. Shard columns
+    are dropped from the files and from schema, which is passed on to
+    save_parquet.
+    """
+    if shard_columns:
+        dedup_columns = [c for c in dedup_columns if c not in shard_columns]
+        if schema is not None:
+            for col in shard_columns:
+                schema = schema.remove(schema.get_field_index(col))
+
+    days = ist_dates(df["ts"].to_numpy())
+    keys = [df[col] for col in shard_columns] + [days]
+    n_parts = 0
+    for key, part_df in df.groupby(keys, sort=True, observed=True):
+        *shard_values, day = key
+        path = partition_path(root, day, zip(shard_columns, shard_values))
+        part_df = part_df.drop(columns=list(shard_columns))
+        merged = merge_and_deduplicate(load_parquet(path), part_df, dedup_columns)
+        save_parquet(merged, path, schema=schema, quiet=True)
+        n_parts += 1
+    log(f"  Saved {len(df)} rows across {n_parts} daily partitions in {root}")
+
+
+def migrate_to_partitions(
+    legacy_file: str,
+    root: str,
+    dedup_columns: List[str],
+    schema: Optional[pa.Schema] = None,
+    shard_columns: Tuple[str, ...] = (),
+) -> None:
+    """
+    One-time conversion of a single-file dataset into daily partitions.
+
+    Older runs wrote everything to one Parquet file inside root. If it is
+    still there, split it into partitions and remove it, so incremental
+    updates keep resuming from where it left off.
+    """
+    df = load_parquet(legacy_file)
+    if df is None:
+        return
+    log(f"  Migrating {legacy_file} to daily partitions...")
+    if not df.empty:
+        save_partitioned(
+            add_datetime(df), root, dedup_columns, schema, shard_columns
+        )
+    os.remove(legacy_file)
 
 
 def merge_and_deduplicate(
@@ -330,8 +759,27 @@ def merge_and_deduplicate(
 
     Keeps the last occurrence (new data wins over old).
     Sorts by 'ts' ascending.
+
+    existing_df is expected to be sorted and de-duplicated already (as
+    written by this pipeline). In the usual incremental case every new
+    candle is later than the existing ones, so only new_df is de-duplicated
+    and sorted and the two are simply appended.
     """
-    if existing_df is not None and not existing_df.empty:
+    has_existing = existing_df is not None and not existing_df.empty
+
+    if (
+        has_existing
+        and not new_df.empty
+        and "ts" in new_df.columns
+        and new_df["ts"].min() > existing_df["ts"].max()
+    ):
+        # Disjoint append: nothing in existing_df can clash with new_df.
+        new_df = new_df.drop_duplicates(subset=dedup_columns, keep="last")
+        if not new_df["ts"].is_monotonic_increasing:
+            new_df = new_df.sort_values("ts", kind="mergesort")
+        return pd.concat([existing_df, new_df], ignore_index=True)
+
+    if has_existing:
         combined = pd.concat([existing_df, new_df], ignore_index=True)
     else:
         combined = new_df
@@ -339,80 +787,259 @@ def merge_and_deduplicate(
     # Drop duplicates, keeping last (new data preferred).
     combined = combined.drop_duplicates(subset=dedup_columns, keep="last")
 
-    # Sort by timestamp.
+    # Sort by timestamp (stable, so rows sharing a ts keep their order).
     if "ts" in combined.columns:
-        combined = combined.sort_values("ts").reset_index(drop=True)
+        combined = combined.sort_values("ts", kind="mergesort", ignore_index=True)
 
     return combined
 
 
 # ---------------------------------------------------------------------------
-# Datetime formatting
+# Append-only part datasets
+#
+# Layout: <root>/part-<first ts>-<last ts>.parquet. Each incremental run
+# adds one part holding only the new candles instead of rewriting the
+# whole history; readers load the directory as one dataset. compact_parts
+# folds the parts back into a single file once they pile up.
+# ---------------------------------------------------------------------------
+
+def list_parts(root: str) -> List[str]:
+    """Part files under root, oldest first (empty if none)."""
+    return sorted(glob.glob(os.path.join(root, "part-*.parquet")))
+
+
+def append_part(
+    df: pd.DataFrame,
+    root: str,
+    schema: Optional[pa.Schema] = None,
+    quiet: bool = False,
+) -> str:
+    """
+    Write df (sorted by 'ts') as a new part file under root.
+
+    The file is named after the first and last 'ts' it holds, so parts
+    sort chronologically. Returns the path written.
+    """
+    ts = df["ts"]
+    path = os.path.join(root, f"part-{int(ts.iloc[0])}-{int(ts.iloc[-1])}.parquet")
+    save_parquet(df, path, schema=schema, quiet=quiet)
+    return path
+
+
+def compact_parts(
+    root: str,
+    dedup_columns: List[str],
+    schema: Optional[pa.Schema] = None,
+) -> None:
+    """
+    Merge all part files under root into a single part.
+
+    The merged part is written before the old ones are removed, so an
+    interrupted compaction can leave duplicates behind but never loses
+    data (the next compaction removes them).
+    """
+    parts = list_parts(root)
+    if len(parts) < 2:
+        return
+    combined = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+    merged = merge_and_deduplicate(None, combined, dedup_columns)
+    new_path = append_part(merged, root, schema=schema, quiet=True)
+    for path in parts:
+        if path != new_path:
+            os.remove(path)
+    log(f"  Compacted {len(parts)} parts into {new_path}")
+
+
+# ---------------------------------------------------------------------------
+# API array helpers
+# ---------------------------------------------------------------------------
+
+def pad_array(
+    values: Optional[list],
+    n: int,
+    fill,
+    dtype=np.float64,
+    numeric: bool = False,
+) -> np.ndarray:
+    """
+    Convert one API array to a NumPy array of exactly length n.
+
+    Dhan sometimes returns value arrays shorter than the timestamp array;
+    those are padded with `fill` once, up front, so no per-candle bounds
+    checks are needed. With numeric=True, blanks and other non-numbers
+    become NaN (use a float dtype).
+    """
+    values = (values or [])[:n]
+    if numeric:
+        arr = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+        arr = arr.to_numpy(dtype=dtype)
+    else:
+        arr = np.asarray(values, dtype=dtype)
+    if len(arr) < n:
+        arr = np.concatenate([arr, np.full(n - len(arr), fill, dtype=dtype)])
+    return arr
+
+
+# ---------------------------------------------------------------------------
+# Datetime column
 # ---------------------------------------------------------------------------
 
-def epoch_to_ist_iso(epoch_seconds: int) -> str:
+def add_datetime(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Convert epoch seconds to ISO 8601 string with IST offset.
+    Derive the 'datetime' column from 'ts' as a tz-aware IST timestamp.
 
-    Example: 1609472700 -> "2021-01-01T09:15:00+05:30"
+    Computed in one vectorized pass, and overwrites any existing
+    'datetime' column (e.g. ISO strings from older files). Parquet stores
+    it as a timestamp with tz=+05:30 -- 8 bytes per row instead of a string.
     """
-    dt = datetime.fromtimestamp(epoch_seconds, tz=IST)
-    return dt.isoformat()
+    dt = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(IST)
+    if "datetime" in df.columns:
+        df["datetime"] = dt
+    else:
+        df.insert(df.columns.get_loc("ts") + 1, "datetime", dt)
+    return df
 
 
 # ---------------------------------------------------------------------------
 # Moneyness computation
 # ---------------------------------------------------------------------------
 
+# Category order for the moneyness column (stored dictionary-encoded).
+MONEYNESS_CATEGORIES = ["ITM", "ATM", "OTM"]
+
+
 def compute_moneyness(
     option_type: str,
-    strike: float,
-    spot: float,
-    atm_strike: float,
-) -> str:
+    strike: np.ndarray,
+    spot: np.ndarray,
+    atm_strike: np.ndarray,
+) -> pd.Categorical:
     """
-    Compute moneyness category: ITM, ATM, or OTM.
+    Compute moneyness category (ITM, ATM, or OTM) for arrays of candles.
 
     Args:
-        option_type: "CE" (call) or "PE" (put).
-        strike: The option's strike price.
-        spot: The current spot price of the underlying.
-        atm_strike: The at-the-money strike (spot rounded to nearest step).
+        option_type: "CE" (call) or "PE" (put), scalar or per-candle array.
+        strike: The options' strike prices.
+        spot: The current spot prices of the underlying.
+        atm_strike: The at-the-money strikes (spot rounded to nearest step).
 
     Returns:
+        A Categorical over MONEYNESS_CATEGORIES:
         "ATM" if strike == atm_strike.
         For CALL: "ITM" if strike < spot, "OTM" if strike > spot.
         For PUT:  "ITM" if strike > spot, "OTM" if strike < spot.
+        Missing (NaN) where strike or spot is unknown.
     """
+    strike = np.asarray(strike, dtype=np.float64)
+    spot = np.asarray(spot, dtype=np.float64)
+    atm_strike = np.asarray(atm_strike, dtype=np.float64)
+    is_call = np.asarray(option_type) == "CE"
+
+    itm = np.where(is_call, strike < spot, strike > spot)
+    codes = np.where(itm, 0, 2)
+
     # ATM check: if this is the ATM strike bucket.
-    if abs(strike - atm_strike) < 0.01:
-        return "ATM"
+    codes = np.where(np.abs(strike - atm_strike) < 0.01, 1, codes)
 
-    if option_type == "CE":
-        return "ITM" if strike < spot else "OTM"
-    else:  # PE
-        return "ITM" if strike > spot else "OTM"
+    # -1 is the Categorical code for "missing".
+    codes = np.where(np.isnan(strike) | np.isnan(spot), -1, codes)
+    return pd.Categorical.from_codes(
+        codes.astype(np.int8), categories=MONEYNESS_CATEGORIES
+    )
 
 
 # ---------------------------------------------------------------------------
 # ATM strike computation
 # ---------------------------------------------------------------------------
 
-def compute_atm_strike(spot: float, strike_step: int) -> int:
+def compute_atm_strike(spot: np.ndarray, strike_step: int) -> np.ndarray:
     """
-    Round spot price to the nearest strike step to get ATM strike.
+    Round spot prices to the nearest strike step to get ATM strikes.
 
     NIFTY (step=50):   spot 14013.3 -> 14000
     SENSEX (step=100): spot 48237.5 -> 48200
+
+    NaN spots give NaN strikes.
     """
-    return int(round(spot / strike_step) * strike_step)
+    spot = np.asarray(spot, dtype=np.float64)
+    return np.round(spot / strike_step) * strike_step
 
 
 # ---------------------------------------------------------------------------
 # Progress display
 # ---------------------------------------------------------------------------
 
+# Held while printing, so lines from concurrent workers never interleave.
+_PRINT_LOCK = threading.Lock()
+
+# Per-thread label that log() puts in front of each line (see set_log_tag).
+_LOG_TAG = threading.local()
+
+
+def set_log_tag(tag: str) -> None:
+    """
+    Prefix this thread's log() lines with "[tag] ".
+
+    run_all.py sets one per fetcher; worker_pool passes it on to the
+    pool's threads, so a fetcher's workers are labelled the same way.
+    """
+    _LOG_TAG.value = tag
+
+
+def log(message: str = "") -> None:
+    """Print one line (tagged, see set_log_tag); safe from worker threads."""
+    tag = getattr(_LOG_TAG, "value", "")
+    if tag:
+        message = "\n".join(
+            f"[{tag}] {line}" if line else line for line in message.split("\n")
+        )
+    with _PRINT_LOCK:
+        print(message, flush=True)
+
+
 def print_progress(current: int, total: int, prefix: str = "") -> None:
     """Print a simple progress indicator: [current/total] prefix."""
     pct = (current / total * 100) if total > 0 else 0
-    print(f"  [{current}/{total}] ({pct:.0f}%) {prefix}")
+    log(f"  [{current}/{total}] ({pct:.0f}%) {prefix}")
+
+
+# ---------------------------------------------------------------------------
+# Worker pools and interruption
+# ---------------------------------------------------------------------------
+
+# Set on Ctrl-C. Fetch loops check it between API calls and give up
+# instead of starting new ones, so an interrupted run ends promptly.
+STOP_EVENT = threading.Event()
+
+
+def check_stop() -> None:
+    """Raise RuntimeError if the run has been interrupted (STOP_EVENT)."""
+    if STOP_EVENT.is_set():
+        raise RuntimeError("Interrupted by user.")
+
+
+@contextmanager
+def worker_pool(max_workers: int) -> Iterator[ThreadPoolExecutor]:
+    """
+    Thread pool whose workers log with the creating thread's tag.
+
+    Unlike a plain `with ThreadPoolExecutor()`, leaving it on Ctrl-C does
+    not wait for the running tasks: the interrupt sets STOP_EVENT, cancels
+    queued tasks and is re-raised at once, and running tasks wind down by
+    checking the event. Once STOP_EVENT is set, any pool being left
+    cancels its queued tasks too.
+    """
+    pool = ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=set_log_tag,
+        initargs=(getattr(_LOG_TAG, "value", ""),),
+    )
+    interrupted = False
+    try:
+        yield pool
+    except KeyboardInterrupt:
+        STOP_EVENT.set()
+        interrupted = True
+        raise
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=STOP_EVENT.is_set())